@@ -0,0 +1,99 @@
+"""Synthetic aconnect listings, so the benchmarks run without ALSA hardware"""
+import contextlib
+import os
+import subprocess
+import typing
+from typing import Dict, List, Tuple
+
+import core
+
+FIRST_CLIENT = 128  # where ALSA starts numbering user clients
+
+# /proc/asound/seq/clients of a small studio, with the kernel's header, pool and UMP lines, and what it holds
+PROCFS_SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "seq_clients")
+PROCFS_SAMPLE_INPUTS = {0: [0, 1], 14: [0], 20: [0, 1], 131: [0, 1]}  # client -> readable ports
+PROCFS_SAMPLE_OUTPUTS = {14: [0], 20: [0, 1], 128: [0], 130: [0], 131: [0, 1]}  # client -> writable ports
+PROCFS_SAMPLE_EDGES = {(0, 0, 128, 0), (0, 1, 128, 0), (0, 1, 130, 0), (20, 0, 130, 0), (131, 1, 130, 0)}
+
+
+class Fixture(typing.NamedTuple):
+    inputs: str  # aconnect -i
+    outputs: str  # aconnect -o
+    connections: str  # aconnect -l
+
+    def section(self, param: str) -> str:
+        return {"i": self.inputs, "o": self.outputs, "l": self.connections}[param]
+
+
+def _client_lines(client: int, ports: int, edges: Dict[Tuple[int, int], List[Tuple[int, int]]],
+                  sources: Dict[Tuple[int, int], List[Tuple[int, int]]]) -> List[str]:
+    _lines = [f"client {client}: 'Soft Synth {client}' [type=user,pid={client * 7}]"]
+    for _port in range(ports):
+        _lines.append(f"  {_port:3d} '{f'Synth port {_port}':<16}'")
+        _targets = edges.get((client, _port))
+        if _targets:
+            _lines.append("\tConnecting To: " + ", ".join(f"{_c}:{_p}" for _c, _p in _targets))
+        _origins = sources.get((client, _port))
+        if _origins:
+            _lines.append("\tConnected From: " + ", ".join(f"{_c}:{_p}" for _c, _p in _origins))
+    return _lines
+
+
+def generate(devices: int, ports: int = 4, fan_out: int = 2) -> Fixture:
+    """
+        Every client is readable (listed by -i) when even, writable (-o) when odd, and both every third client.
+        Every readable port connects to fan_out ports of the writable clients that follow it.
+    """
+    _clients = list(range(FIRST_CLIENT, FIRST_CLIENT + devices))
+    _readable = [_c for _i, _c in enumerate(_clients) if _i % 2 == 0 or _i % 3 == 0]
+    _writable = [_c for _i, _c in enumerate(_clients) if _i % 2 == 1 or _i % 3 == 0]
+
+    _edges: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+    _sources: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+    for _i, _client in enumerate(_readable):
+        for _port in range(ports):
+            for _k in range(min(fan_out, len(_writable))):
+                _target = (_writable[(_i + _k) % len(_writable)], (_port + _k) % ports)
+                _edges.setdefault((_client, _port), []).append(_target)
+                _sources.setdefault(_target, []).append((_client, _port))
+
+    def _listing(clients: List[int]) -> str:
+        return "\n".join(_line for _client in clients for _line in _client_lines(_client, ports, _edges, _sources))
+
+    return Fixture(_listing(_readable), _listing(_writable), _listing(_clients))
+
+
+class StubRunner:
+    """Stands in for subprocess.getstatusoutput, answering aconnect listings from a fixture and counting the calls"""
+
+    def __init__(self, fixture: Fixture):
+        self.fixture = fixture
+        self.calls = 0
+
+    def __call__(self, command: str) -> typing.Tuple[int, str]:
+        self.calls += 1
+        # AConnectBackend asks for all three listings in one shell, separated by echoed markers
+        _separator = core.AConnectBackend.SNAPSHOT_SEPARATOR
+        return 0, f"\n{_separator}\n".join(self.fixture.section(_part.rstrip().rsplit("-", 1)[1])
+                                           for _part in command.split(f"; echo {_separator}; "))
+
+
+@contextlib.contextmanager
+def installed(runner: StubRunner):
+    """Routes every aconnect call through runner and drops the cached snapshot before and after"""
+    _original = subprocess.getstatusoutput
+    subprocess.getstatusoutput = runner
+    core.AConnectionHandler.invalidate()
+    try:
+        yield runner
+    finally:
+        subprocess.getstatusoutput = _original
+        core.AConnectionHandler.invalidate()
+
+
+def procfs_sample_matches(snapshot: core.TopologySnapshot) -> bool:
+    def _ports(clients) -> Dict[int, List[int]]:
+        return {_client.id: [_port.id for _port in _client.ports] for _client in clients}
+
+    return _ports(snapshot.inputs) == PROCFS_SAMPLE_INPUTS and _ports(snapshot.outputs) == PROCFS_SAMPLE_OUTPUTS \
+        and set(snapshot.edges) == PROCFS_SAMPLE_EDGES
@@ -0,0 +1,67 @@
+"""
+    Reports the memory each Node costs, run with QT_QPA_PLATFORM=offscreen on machines without a display:
+
+        python3 benchmarks/memory.py --nodes 1000 --ports 8
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtWidgets import QApplication, QFrame, QVBoxLayout
+
+import utils
+
+
+def resident_bytes() -> int:
+    with open("/proc/self/statm") as _file:
+        return int(_file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def make_devices(count: int, ports: int):
+    return [utils.MidiDevice(_client, f"Soft Synth {_client}", "[type=user]", _client % 2,
+                             [utils.Port(_port, f"port {_port}", _client) for _port in range(ports)])
+            for _client in range(count)]
+
+
+def measure(count: int, ports: int, channel_mode: str) -> dict:
+    _place_holder = QFrame()
+    _place_holder.setLayout(QVBoxLayout())
+    _view = utils.QDMNodeEditor(_place_holder, utils.QDMNodeEditorScene(25, 5, None), None)
+    _devices = make_devices(count, ports)
+    utils.Node(_devices[0], _view, channel_mode=channel_mode)  # warm up the shared style and Qt's caches
+
+    gc.collect()
+    _rss = resident_bytes()
+    tracemalloc.start()
+    _nodes = [utils.Node(_device, _view, channel_mode=channel_mode) for _device in _devices]
+    _view.scene.add_items(_nodes)
+    gc.collect()
+    _python, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    _rss = resident_bytes() - _rss
+
+    return {"nodes": count, "ports": ports, "channel_mode": channel_mode,
+            "rss_bytes_per_node": _rss / count, "python_bytes_per_node": _python / count}
+
+
+def main(argv=None) -> int:
+    _parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    _parser.add_argument("--nodes", type=int, default=1000)
+    _parser.add_argument("--ports", type=int, default=8)
+    _parser.add_argument("--channel-mode", choices=[utils.Node.CHANNEL_ITEMS, utils.Node.CHANNEL_WIDGETS],
+                         default=utils.Node.CHANNEL_ITEMS)
+    _args = _parser.parse_args(argv)
+
+    _app = QApplication(sys.argv[:1])
+    json.dump(measure(_args.nodes, _args.ports, _args.channel_mode), sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
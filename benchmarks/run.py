@@ -0,0 +1,240 @@
+"""
+    Times the hot paths at growing topology sizes and writes the results as JSON. Needs no display and no ALSA:
+
+        QT_QPA_PLATFORM=offscreen python3 benchmarks/run.py --output results.json
+        QT_QPA_PLATFORM=offscreen python3 benchmarks/run.py --baseline results.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import core
+import fixtures
+import scenefile
+
+SIZES = (10, 100, 1000, 5000)
+PORTS = 4
+LARGE_LISTING = (5000, 10)  # clients and ports per client of the parser benchmark, 50,000 ports in all
+CLI_COLD_START_BUDGET = 0.1  # seconds for python main.py list to start, read the procfs sample and exit
+PARSE_BUDGET = 0.1  # seconds to parse the -l listing of LARGE_LISTING size
+VIEWPORT = (1920, 1080)
+NOISE_FLOOR = 0.001  # seconds, slowdowns smaller than this are not reported as regressions
+
+
+def measure(run: typing.Callable[[], None], repeat: int, setup: typing.Callable[[], None] = None,
+            teardown: typing.Callable[[], None] = None) -> dict:
+    _times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        _start = time.perf_counter()
+        run()
+        _times.append(time.perf_counter() - _start)
+        if teardown is not None:
+            teardown()
+    return {"min": min(_times), "median": statistics.median(_times), "repeat": repeat}
+
+
+def cli_cold_start(repeat: int) -> dict:
+    """Runs main.py list on the procfs sample in a fresh interpreter, which must not pull in PyQt5"""
+    _command = [sys.executable, "main.py", "--procfs-path", fixtures.PROCFS_SAMPLE, "list"]
+    # -X importtime slows the start down, so the import check gets a run of its own
+    _imports = subprocess.run([sys.executable, "-X", "importtime", *_command[1:]], cwd=ROOT,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if _imports.returncode != 0 or "PyQt5" in _imports.stderr:
+        _error = "PyQt5 imported" if _imports.returncode == 0 else f"exit status {_imports.returncode}"
+        return {"budget": CLI_COLD_START_BUDGET, "ok": False, "error": _error}
+    _times = []
+    for _ in range(repeat):
+        _start = time.perf_counter()
+        subprocess.run(_command, cwd=ROOT, stdout=subprocess.DEVNULL, check=True)
+        _times.append(time.perf_counter() - _start)
+    return {"min": min(_times), "median": statistics.median(_times), "repeat": repeat,
+            "budget": CLI_COLD_START_BUDGET, "ok": min(_times) <= CLI_COLD_START_BUDGET}
+
+
+def procfs_sample(repeat: int) -> dict:
+    """Reads the captured /proc/asound/seq/clients through ProcfsBackend and checks what it parsed"""
+    _backend = core.ProcfsBackend(fixtures.PROCFS_SAMPLE)
+    _timing = measure(_backend.read_snapshot, repeat)
+    _timing["ok"] = fixtures.procfs_sample_matches(_backend.read_snapshot())
+    return _timing
+
+
+def large_listing(repeat: int) -> Dict[str, dict]:
+    """Parses aconnect listings of LARGE_LISTING size, connection lines included"""
+    _fixture = fixtures.generate(*LARGE_LISTING)
+    _handler = core.AConnectionHandler
+    _results = {"parse_listing": measure(lambda: _handler.parse_aconnect_output(_fixture.connections), repeat),
+                "parse_clients": measure(lambda: _handler.parse_aconnect_output(_fixture.inputs, edges=False),
+                                         repeat)}
+    _results["parse_listing"].update(budget=PARSE_BUDGET, ok=_results["parse_listing"]["min"] <= PARSE_BUDGET)
+    with fixtures.installed(fixtures.StubRunner(_fixture)):
+        _results["read_snapshot"] = measure(core.AConnectBackend().read_snapshot, repeat)
+    return _results
+
+
+def run_size(ui, devices: int, repeat: int) -> Dict[str, dict]:
+    from PyQt5.QtCore import QRectF
+    from PyQt5.QtGui import QImage, QPainter
+    from PyQt5.QtWidgets import QStyleOptionGraphicsItem
+
+    import utils
+
+    _results = {}
+    _handler = core.AConnectionHandler
+    with fixtures.installed(fixtures.StubRunner(fixtures.generate(devices, PORTS))):
+        _results["parse_device_list"] = measure(lambda: (_handler.parse_device_list("i"),
+                                                         _handler.parse_device_list("o")), repeat)
+        _results["get_connections"] = measure(_handler.get_connections, repeat, setup=_handler.invalidate)
+        _snapshot = _handler.get_snapshot()
+        _devices = _snapshot.input_devices + _snapshot.output_devices
+        _graph = _snapshot.graph
+
+    _view = ui.connections_view
+    _scene = _view.scene
+    _nodes: List[utils.Node] = []
+
+    def _build():
+        _nodes[:] = [utils.Node(_device, _view) for _device in _devices]
+
+    def _clear():
+        for _node in ui.nodes:
+            _scene.removeItem(_node)
+        ui.nodes = []
+
+    _results["node_construction"] = measure(_build, repeat, teardown=lambda: _nodes.clear())
+
+    def _fill():
+        _build()
+        ui.nodes = list(_nodes)
+
+    _results["update_nodes"] = measure(ui.update_nodes, repeat, setup=_fill, teardown=_clear)
+
+    _image = QImage(*VIEWPORT, QImage.Format_ARGB32_Premultiplied)
+    _rect = QRectF(0, 0, *VIEWPORT)
+
+    def _draw_background():
+        _painter = QPainter(_image)
+        _scene.drawBackground(_painter, _rect)
+        _painter.end()
+
+    _scene.cached_background = False
+    _results["draw_background_uncached"] = measure(_draw_background, repeat)
+    _scene.cached_background = True
+    _results["draw_background"] = measure(_draw_background, repeat)
+
+    _build()
+    _option = QStyleOptionGraphicsItem()
+
+    def _paint_nodes():
+        _painter = QPainter(_image)
+        for _node in _nodes:
+            _node.paint(_painter, _option)
+        _painter.end()
+
+    _results["node_paint"] = measure(_paint_nodes, repeat)
+
+    _records = [scenefile.NodeRecord(_device.id, _device.type.value, _device.name, _device.args,
+                                     [(_port.id, _port.name) for _port in _device.channels], _i * 10.0, _i * 5.0)
+                for _i, _device in enumerate(_devices)]
+    _edges = [scenefile.EdgeRecord(*_edge) for _edge in sorted(_graph)]
+    with tempfile.TemporaryDirectory() as _directory:
+        _path = os.path.join(_directory, "bench" + scenefile.EXTENSION)
+        _results["scene_save"] = measure(lambda: scenefile.save_scene(_path, _records, _edges), repeat)
+        _results["scene_load"] = measure(lambda: scenefile.load_scene(_path), repeat)
+
+    _nodes.clear()
+    return _results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Lists every timing that got slower than tolerance times its baseline"""
+    _regressions = []
+    for _name, _sizes in results["benchmarks"].items():
+        for _size, _timing in _sizes.items():
+            _before = baseline.get("benchmarks", {}).get(_name, {}).get(_size)
+            if _before and _timing["min"] > _before["min"] * tolerance and \
+                    _timing["min"] - _before["min"] > NOISE_FLOOR:
+                _regressions.append(f"{_name} at {_size} devices: {_before['min'] * 1000:.2f} ms -> "
+                                    f"{_timing['min'] * 1000:.2f} ms")
+    return _regressions
+
+
+def main(argv=None) -> int:
+    _parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    _parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="device counts to run at")
+    _parser.add_argument("--repeat", type=int, default=5)
+    _parser.add_argument("--output", help="JSON file to write, stdout if omitted")
+    _parser.add_argument("--baseline", help="JSON file of an earlier run to compare against")
+    _parser.add_argument("--tolerance", type=float, default=1.5, help="slowdown factor that counts as a regression")
+    _args = _parser.parse_args(argv)
+
+    os.chdir(ROOT)  # the UI loads its stylesheet and design files relative to the repository
+
+    from PyQt5.QtCore import QT_VERSION_STR
+    from PyQt5.QtWidgets import QApplication
+
+    import main as gui
+
+    _app = QApplication(sys.argv[:1])
+    with fixtures.installed(fixtures.StubRunner(fixtures.generate(0))):
+        _ui = gui.UI()
+        _ui.refresh_timer.stop()
+        _ui.refresher.stop()
+
+    _results = {
+        "meta": {"python": platform.python_version(), "qt": QT_VERSION_STR, "platform": platform.platform(),
+                 "timestamp": time.time(), "repeat": _args.repeat, "ports_per_device": PORTS},
+        "cli_cold_start": cli_cold_start(_args.repeat),
+        "procfs_sample": procfs_sample(_args.repeat),
+        "benchmarks": {},
+    }
+    for _size in _args.sizes:
+        for _name, _timing in run_size(_ui, _size, _args.repeat).items():
+            _results["benchmarks"].setdefault(_name, {})[str(_size)] = _timing
+    _size = "x".join(str(_count) for _count in LARGE_LISTING)
+    for _name, _timing in large_listing(_args.repeat).items():
+        _results["benchmarks"].setdefault(_name, {})[_size] = _timing
+
+    if _args.output:
+        with open(_args.output, "w", encoding="utf-8") as _file:
+            json.dump(_results, _file, indent=2)
+    else:
+        json.dump(_results, sys.stdout, indent=2)
+        print()
+
+    _failed = not _results["cli_cold_start"]["ok"]
+    if _failed:
+        print(f"CLI cold start over budget: {_results['cli_cold_start']}", file=sys.stderr)
+    _parse = _results["benchmarks"]["parse_listing"][_size]
+    if not _parse["ok"]:
+        print(f"Parsing the {_size} listing over budget: {_parse['min'] * 1000:.0f} ms, budget "
+              f"{PARSE_BUDGET * 1000:.0f} ms", file=sys.stderr)
+        _failed = True
+    if not _results["procfs_sample"]["ok"]:
+        print(f"ProcfsBackend misread {fixtures.PROCFS_SAMPLE}", file=sys.stderr)
+        _failed = True
+    if _args.baseline:
+        with open(_args.baseline, encoding="utf-8") as _file:
+            _regressions = compare(_results, json.load(_file), _args.tolerance)
+        for _regression in _regressions:
+            print(f"regression: {_regression}", file=sys.stderr)
+        _failed = _failed or bool(_regressions)
+    return 1 if _failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
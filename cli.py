@@ -0,0 +1,120 @@
+import argparse
+import sys
+import typing
+from typing import List, Tuple
+
+import core
+import scenefile
+
+# Kept free of PyQt imports, main.py dispatches here before the GUI is loaded
+COMMANDS = ("list", "dump", "apply", "diff")
+
+
+def is_command(argv: List[str]) -> bool:
+    return any(_arg in COMMANDS for _arg in argv)
+
+
+def format_edge(edge) -> str:
+    return f"{edge.src_client}:{edge.src_port} -> {edge.dst_client}:{edge.dst_port}"
+
+
+def snapshot_records(snapshot: core.TopologySnapshot) -> Tuple[List[scenefile.NodeRecord], List[scenefile.EdgeRecord]]:
+    _nodes = [scenefile.NodeRecord(_client.id, _type, _client.name, _client.args,
+                                   [(_port.id, _port.name) for _port in _client.ports])
+              for _type, _clients in ((core.DeviceType.input, snapshot.inputs),
+                                      (core.DeviceType.output, snapshot.outputs))
+              for _client in _clients]
+    return _nodes, [scenefile.EdgeRecord(*_edge) for _edge in sorted(snapshot.edges)]
+
+
+def scene_edges(path: str) -> typing.Set[core.Edge]:
+    _nodes, _edges, _ = scenefile.replay(path)
+    return {core.Edge(*_edge) for _edge in _edges}
+
+
+def cmd_list(args) -> int:
+    _snapshot = core.AConnectionHandler.get_snapshot()
+    for _device in _snapshot.input_devices + _snapshot.output_devices:
+        print(f"{_device.id}: {_device.name} - {_device.type!r} {_device.args}")
+        for _channel in _device.channels:
+            print(f"    {_channel[0]}: {_channel[1]}")
+    if _snapshot.edges:
+        print("Connections:")
+        for _edge in sorted(_snapshot.edges):
+            print(f"    {format_edge(_edge)}")
+    return 0
+
+
+def cmd_dump(args) -> int:
+    _nodes, _edges = snapshot_records(core.AConnectionHandler.get_snapshot())
+    if args.output:
+        scenefile.save_scene(args.output, _nodes, _edges)
+    else:
+        scenefile.write_scene(sys.stdout, _nodes, _edges)
+    return 0
+
+
+def cmd_diff(args) -> int:
+    _target = scene_edges(args.scene)
+    _current = set(core.AConnectionHandler.get_snapshot(max_age=0).edges)
+    _changes = [("+", _edge) for _edge in sorted(_target - _current)]
+    if args.prune:
+        _changes = [("-", _edge) for _edge in core.AConnectionHandler.prunable(_current - _target)] + _changes
+    for _sign, _edge in _changes:
+        print(f"{_sign} {format_edge(_edge)}")
+    return 1 if _changes else 0
+
+
+def cmd_apply(args) -> int:
+    _results = core.AConnectionHandler.apply_patch(scene_edges(args.scene), max_workers=args.jobs,
+                                                   prune=args.prune)
+    _failed = 0
+    for _result in _results:
+        if _result.ok:
+            print(f"{_result.action} {format_edge(_result.edge)}")
+        else:
+            _failed += 1
+            print(f"{_result.action} {format_edge(_result.edge)} failed: {_result.output}", file=sys.stderr)
+    return 1 if _failed else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    _parser = argparse.ArgumentParser(prog="main.py", description="Inspect and restore ALSA MIDI connections")
+    _parser.add_argument("--procfs", action="store_true",
+                         help=f"read the topology from {core.ProcfsBackend.DEFAULT_PATH} instead of aconnect")
+    _parser.add_argument("--procfs-path", metavar="PATH",
+                         help="read the topology from PATH, a copy of the procfs file, implies --procfs")
+    _commands = _parser.add_subparsers(dest="command", required=True)
+
+    _commands.add_parser("list", help="list devices, ports and connections").set_defaults(run=cmd_list)
+
+    _dump = _commands.add_parser("dump", help="write the current topology as a scene file")
+    _dump.add_argument("output", nargs="?", help="scene file to write, stdout if omitted")
+    _dump.set_defaults(run=cmd_dump)
+
+    for _name, _run, _help in (("diff", cmd_diff, "show the connection changes apply would make"),
+                               ("apply", cmd_apply, "make the current connections match a scene file")):
+        _command = _commands.add_parser(_name, help=_help)
+        _command.add_argument("scene")
+        _command.add_argument("--prune", action="store_true",
+                              help="also remove connections that are not in the scene, except those of client 0")
+        if _name == "apply":
+            _command.add_argument("-j", "--jobs", type=int, default=4, help="aconnect calls to run in parallel")
+        _command.set_defaults(run=_run)
+
+    return _parser
+
+
+def main(argv: List[str]) -> int:
+    _args = build_parser().parse_args(argv)
+    if _args.procfs or _args.procfs_path:
+        core.AConnectionHandler.use_backend(core.ProcfsBackend(_args.procfs_path or core.ProcfsBackend.DEFAULT_PATH))
+    try:
+        return _args.run(_args)
+    except (OSError, RuntimeError, scenefile.SceneFormatError) as _error:
+        print(f"error: {_error}", file=sys.stderr)
+        return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,498 @@
+import abc
+import re
+import subprocess
+import threading
+import time
+import typing
+from typing import List, NamedTuple
+
+import instrument
+
+
+class DeviceType:
+    """There are only two device types, DeviceType(value) hands out one shared instance per value"""
+    __slots__ = ("value",)
+
+    input = 0
+    output = 1
+
+    _instances: typing.Dict[int, "DeviceType"] = {}
+
+    def __new__(cls, value):
+        _instance = cls._instances.get(value)
+        if _instance is None:
+            _instance = cls._instances[value] = super().__new__(cls)
+            _instance.value = value
+        return _instance
+
+    def __reduce__(self):
+        return DeviceType, (self.value,)
+
+    def __repr__(self):
+        if self.value == DeviceType.input:
+            return "Input"
+        elif self.value == DeviceType.output:
+            return "Output"
+        else:
+            raise ValueError("DeviceType's value must always be in range [0, 1] - Input/Output")
+
+
+class Port(NamedTuple):
+    id: int
+    name: str
+    client: int
+
+
+class Client(NamedTuple):
+    id: int
+    name: str
+    args: str
+    ports: List[Port]
+
+
+class Edge(NamedTuple):
+    src_client: int
+    src_port: int
+    dst_client: int
+    dst_port: int
+
+
+class PatchResult(NamedTuple):
+    edge: Edge
+    action: str  # "connect" or "disconnect"
+    ok: bool
+    output: str
+
+
+CommandRunner = typing.Callable[[str], typing.Tuple[int, str]]  # shell command -> (exit status, output)
+
+PortKey = typing.Tuple[int, int]  # (client, port)
+
+
+class ConnectionGraph:
+    """Connections indexed by source port, destination port and client for constant time lookups"""
+
+    def __init__(self, edges: typing.Iterable[Edge] = ()):
+        self._edges: typing.Set[Edge] = set()
+        self._successors: typing.Dict[PortKey, typing.Set[PortKey]] = {}
+        self._predecessors: typing.Dict[PortKey, typing.Set[PortKey]] = {}
+        self._client_edges: typing.Dict[int, typing.Set[Edge]] = {}
+
+        for _edge in edges:
+            self.add(_edge)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: "TopologySnapshot") -> "ConnectionGraph":
+        return cls(snapshot.edges)
+
+    def add(self, edge: Edge) -> bool:
+        if edge in self._edges:
+            return False
+        self._edges.add(edge)
+
+        _src, _dst = (edge.src_client, edge.src_port), (edge.dst_client, edge.dst_port)
+        self._successors.setdefault(_src, set()).add(_dst)
+        self._predecessors.setdefault(_dst, set()).add(_src)
+        self._client_edges.setdefault(edge.src_client, set()).add(edge)
+        self._client_edges.setdefault(edge.dst_client, set()).add(edge)
+        return True
+
+    def remove(self, edge: Edge) -> bool:
+        if edge not in self._edges:
+            return False
+        self._edges.remove(edge)
+
+        _src, _dst = (edge.src_client, edge.src_port), (edge.dst_client, edge.dst_port)
+        self._discard(self._successors, _src, _dst)
+        self._discard(self._predecessors, _dst, _src)
+        self._discard(self._client_edges, edge.src_client, edge)
+        self._discard(self._client_edges, edge.dst_client, edge)
+        return True
+
+    @staticmethod
+    def _discard(index: dict, key, value):
+        # Empty buckets are dropped so that the indexes only ever hold connected ports
+        _bucket = index.get(key)
+        if _bucket is not None:
+            _bucket.discard(value)
+            if not _bucket:
+                del index[key]
+
+    def successors(self, port: PortKey) -> typing.FrozenSet[PortKey]:
+        return frozenset(self._successors.get(port, ()))
+
+    def predecessors(self, port: PortKey) -> typing.FrozenSet[PortKey]:
+        return frozenset(self._predecessors.get(port, ()))
+
+    def out_degree(self, port: PortKey) -> int:
+        return len(self._successors.get(port, ()))
+
+    def in_degree(self, port: PortKey) -> int:
+        return len(self._predecessors.get(port, ()))
+
+    def degree(self, port: PortKey) -> int:
+        return self.out_degree(port) + self.in_degree(port)
+
+    def client_edges(self, client: int) -> typing.FrozenSet[Edge]:
+        return frozenset(self._client_edges.get(client, ()))
+
+    def __contains__(self, edge: Edge) -> bool:
+        return edge in self._edges
+
+    def __iter__(self) -> typing.Iterator[Edge]:
+        return iter(self._edges)
+
+    def __len__(self) -> int:
+        return len(self._edges)
+
+    def __repr__(self):
+        return f"ConnectionGraph(ports: {len(self._successors.keys() | self._predecessors.keys())}, " \
+               f"connections: {len(self._edges)})"
+
+
+class TopologySnapshot:
+    """Clients, ports, capabilities and connections taken from a single acquisition"""
+
+    def __init__(self, inputs: List[Client], outputs: List[Client], edges: List[Edge],
+                 timestamp: typing.Optional[float] = None):
+        # inputs hold the readable ports of each client, outputs the writable ones
+        self.inputs = inputs
+        self.outputs = outputs
+        self.edges = edges
+        self.timestamp = time.monotonic() if timestamp is None else timestamp
+
+        self._input_devices: typing.Optional[List["MidiDevice"]] = None
+        self._output_devices: typing.Optional[List["MidiDevice"]] = None
+        self._connections: typing.Optional[list] = None
+        self._graph: typing.Optional[ConnectionGraph] = None
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.timestamp
+
+    @property
+    def input_devices(self) -> List["MidiDevice"]:
+        if self._input_devices is None:
+            self._input_devices = [MidiDevice(_client.id, _client.name, _client.args, DeviceType.input,
+                                              list(_client.ports)) for _client in self.inputs]
+        return self._input_devices
+
+    @property
+    def output_devices(self) -> List["MidiDevice"]:
+        if self._output_devices is None:
+            self._output_devices = [MidiDevice(_client.id, _client.name, _client.args, DeviceType.output,
+                                               list(_client.ports)) for _client in self.outputs]
+        return self._output_devices
+
+    @property
+    def connections(self) -> list:
+        if self._connections is None:
+            self._connections = [[[_edge.src_client, _edge.src_port], [_edge.dst_client, _edge.dst_port]]
+                                 for _edge in self.edges]  # [[From where], [to where]]
+        return self._connections
+
+    @property
+    def graph(self) -> ConnectionGraph:
+        if self._graph is None:
+            self._graph = ConnectionGraph.from_snapshot(self)
+        return self._graph
+
+    def __repr__(self):
+        return f"TopologySnapshot(inputs: {len(self.inputs)}, outputs: {len(self.outputs)}, " \
+               f"connections: {len(self.edges)})"
+
+
+class SequencerBackend(abc.ABC):
+    """Source of the ALSA sequencer topology used by AConnectionHandler"""
+
+    @abc.abstractmethod
+    def read_snapshot(self) -> TopologySnapshot:
+        pass
+
+
+class AConnectBackend(SequencerBackend):
+    SNAPSHOT_SEPARATOR = "@@MIDICONNECTOR_SECTION@@"
+
+    def read_snapshot(self) -> TopologySnapshot:
+        """Runs aconnect -i, -o and -l in one shell and parses all three listings"""
+        # set -e stops at the first failing aconnect, so its exit status becomes the shell's
+        _command = "set -e; " + f"; echo {self.SNAPSHOT_SEPARATOR}; ".join(
+            f"{AConnectionHandler.ACONNECT_COMMAND} -{_param}" for _param in "iol")
+        _sections = AConnectionHandler.run_aconnect(_command).split(self.SNAPSHOT_SEPARATOR)
+        if len(_sections) != 3:
+            raise RuntimeError(f"Unexpected aconnect output, got {len(_sections)} sections instead of 3")
+
+        _inputs, _ = AConnectionHandler.parse_aconnect_output(_sections[0], edges=False)
+        _outputs, _ = AConnectionHandler.parse_aconnect_output(_sections[1], edges=False)
+        _, _edges = AConnectionHandler.parse_aconnect_output(_sections[2], clients=False)
+        return TopologySnapshot(_inputs, _outputs, _edges)
+
+
+class ProcfsBackend(SequencerBackend):
+    """Reads the sequencer state the kernel exposes in /proc, without spawning any process"""
+    DEFAULT_PATH = "/proc/asound/seq/clients"
+
+    _CLIENT_LINE = re.compile(r'^Client\s+(\d+)\s*:\s*"(.*)"\s*\[(.*)\]\s*$')
+    _PORT_LINE = re.compile(r'^\s+Port\s+(\d+)\s*:\s*"(.*)"\s*\((.{4})\)')
+    _CONNECTING_LINE = re.compile(r"^\s+Connecting To:\s*(.*)$")
+    _ADDRESS = re.compile(r"(\d+):(\d+)")
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+
+    def read_snapshot(self) -> TopologySnapshot:
+        with open(self.path, encoding="utf-8", errors="replace") as _file:
+            return self.parse(_file.read())
+
+    @classmethod
+    def parse(cls, text: str) -> TopologySnapshot:
+        _inputs: List[Client] = []
+        _outputs: List[Client] = []
+        _edges: List[Edge] = []
+        _client_id: typing.Optional[int] = None
+        _port: typing.Optional[Port] = None
+
+        for _line in text.splitlines():
+            _match = cls._CLIENT_LINE.match(_line)
+            if _match:
+                _id, _name, _kind = _match.groups()
+                _args = f"[type={_kind.split()[0].lower()}]" if _kind else ""
+                _client_id = int(_id)
+                _port = None
+                _inputs.append(Client(_client_id, _name, _args, []))
+                _outputs.append(Client(_client_id, _name, _args, []))
+                continue
+            if _client_id is None:  # header lines before the first client
+                continue
+
+            _match = cls._PORT_LINE.match(_line)
+            if _match:
+                _id, _name, _caps = _match.groups()
+                if _caps[2] != "e":  # aconnect hides ports that are not exported as well
+                    _port = None
+                    continue
+                _port = Port(int(_id), _name, _client_id)
+                if _caps[0] == "R":
+                    _inputs[-1].ports.append(_port)
+                if _caps[1] == "W":
+                    _outputs[-1].ports.append(_port)
+                continue
+
+            _match = cls._CONNECTING_LINE.match(_line)
+            if _match and _port is not None:
+                _edges.extend(Edge(_port.client, _port.id, int(_dst_client), int(_dst_port))
+                              for _dst_client, _dst_port in cls._ADDRESS.findall(_match.group(1)))
+
+        return TopologySnapshot([_client for _client in _inputs if _client.ports],
+                                [_client for _client in _outputs if _client.ports], _edges)
+
+
+class AConnectionHandler:
+    ACONNECT_COMMAND = "export LANG=en_EN.UTF-8; aconnect"  # make sure the output is a certain language
+    SYSTEM_CLIENT = 0  # the kernel's Timer and Announce ports, subscribed to by PipeWire, JACK and a2jmidid
+    STATUS_MARKER = "@@MIDICONNECTOR_STATUS@@"
+
+    # Seconds a snapshot is reused before aconnect is asked again
+    snapshot_ttl: float = 1.0
+    _snapshot: typing.Optional[TopologySnapshot] = None
+    _snapshot_lock = threading.Lock()
+
+    backend: SequencerBackend = AConnectBackend()
+
+    @classmethod
+    def run_aconnect(cls, command: str) -> str:
+        """Runs command in a shell and returns its output, a missing or failing aconnect raises RuntimeError"""
+        _status, _output = subprocess.getstatusoutput(command)
+        if _status != 0:
+            _reason = _output.strip().rsplit("\n", 1)[-1]
+            raise RuntimeError(f"aconnect failed with exit status {_status}: {_reason}")
+        return _output
+
+    @classmethod
+    def parse_device_list(cls, param: str) -> List[Client]:
+        return cls.parse_aconnect_output(cls.run_aconnect(f"{cls.ACONNECT_COMMAND} -{param}"), edges=False)[0]
+
+    @classmethod
+    def parse_aconnect_output(cls, stdout: str, clients: bool = True,
+                              edges: bool = True) -> typing.Tuple[List[Client], List[Edge]]:
+        """
+            Single pass over aconnect's listing, dispatching on the first character of each line. Clients or edges
+            that are not asked for are not built, the snapshot only needs the clients of -i and -o and the edges of -l.
+        """
+        _clients: List[Client] = []
+        _edges: List[Edge] = []
+        _ports: List[Port] = []
+        _client_id = 0
+        _port_id = 0
+        # Skips the generated NamedTuple.__new__, about a third of the time on the 50,000 port listing of
+        # benchmarks/run.py
+        _new = tuple.__new__
+
+        for _line in stdout.splitlines():
+            _first = _line[:1]
+            if _first == " ":  # "  %3d '%-16s'" declares a port
+                _head, _, _name = _line.partition("'")
+                _port_id = int(_head)
+                if clients:
+                    _ports.append(_new(Port, (_port_id, _name[:-1].rstrip(), _client_id)))
+            elif _first == "\t":  # "\tConnecting To: 128:0, 129:0[real:0]" / "\tConnected From: ..."
+                # every connection is also listed at its source port, so "Connected From" can be skipped
+                if edges and _line.startswith("\tConnecting To: "):
+                    for _address in _line[16:].split(", "):
+                        _dst_client, _, _dst_port = _address.partition(":")
+                        _flags = _dst_port.find("[")
+                        if _flags >= 0:
+                            _dst_port = _dst_port[:_flags]
+                        _edges.append(_new(Edge, (_client_id, _port_id, int(_dst_client), int(_dst_port))))
+            elif _first == "c":  # "client %d: '%s' [type=...]" declares a client
+                _head, _, _rest = _line.partition(": '")
+                _client_id = int(_head[7:])
+                if clients:
+                    _name, _sep, _args = _rest.rpartition("' ")
+                    if not _sep:
+                        _name, _args = _rest.rstrip("'"), ""
+                    _ports = []
+                    _clients.append(_new(Client, (_client_id, _name, _args, _ports)))
+
+        return _clients, _edges
+
+    @classmethod
+    def acquire_snapshot(cls) -> TopologySnapshot:
+        return cls.backend.read_snapshot()
+
+    @classmethod
+    def use_backend(cls, backend: SequencerBackend):
+        cls.backend = backend
+        cls.invalidate()
+
+    @classmethod
+    def get_snapshot(cls, max_age: typing.Optional[float] = None) -> TopologySnapshot:
+        """Returns the cached snapshot, acquiring a new one if it is older than max_age (defaults to snapshot_ttl)"""
+        if max_age is None:
+            max_age = cls.snapshot_ttl
+        with cls._snapshot_lock:  # the refresh worker and the GUI thread may ask at the same time
+            _snapshot = cls._snapshot
+            if _snapshot is None or _snapshot.age > max_age:
+                _snapshot = cls._snapshot = cls.acquire_snapshot()
+        return _snapshot
+
+    @classmethod
+    def invalidate(cls):
+        cls._snapshot = None
+
+    @classmethod
+    def get_output_devices(cls) -> List["MidiDevice"]:
+        return list(cls.get_snapshot().output_devices)
+
+    @classmethod
+    def get_input_devices(cls) -> List["MidiDevice"]:
+        return list(cls.get_snapshot().input_devices)
+
+    @classmethod
+    def get_connections(cls):
+        return list(cls.get_snapshot().connections)
+
+    @classmethod
+    def get_graph(cls) -> ConnectionGraph:
+        return cls.get_snapshot().graph
+
+    @classmethod
+    def as_edge(cls, connection) -> Edge:
+        """Accepts an Edge or a [[from_client, from_port], [to_client, to_port]] pair as returned by get_connections"""
+        if isinstance(connection, Edge):
+            return connection
+        (_src_client, _src_port), (_dst_client, _dst_port) = connection
+        return Edge(int(_src_client), int(_src_port), int(_dst_client), int(_dst_port))
+
+    @classmethod
+    def apply_patch(cls, target_edges: typing.Iterable, runner: typing.Optional[CommandRunner] = None,
+                    max_workers: int = 4, batch_size: int = 16, prune: bool = False) -> List[PatchResult]:
+        """
+            Adds the connections of target_edges that are missing and, if prune is set, disconnects the ones not in
+            target_edges. Connections of SYSTEM_CLIENT are never disconnected. Operations are grouped into batches of
+            one shell call each, which run on at most max_workers threads.
+        """
+        if runner is None:
+            runner = subprocess.getstatusoutput
+
+        _target = {cls.as_edge(_connection) for _connection in target_edges}
+        _current = set(cls.get_snapshot(max_age=0).graph)
+
+        _results: List[PatchResult] = []
+        try:
+            if prune:
+                _results.extend(cls._run_operations("disconnect", cls.prunable(_current - _target), runner,
+                                                    max_workers, batch_size))
+            _results.extend(cls._run_operations("connect", sorted(_target - _current), runner, max_workers,
+                                                batch_size))
+        finally:
+            cls.invalidate()
+        return _results
+
+    @classmethod
+    def prunable(cls, edges: typing.Iterable[Edge]) -> List[Edge]:
+        return sorted(_edge for _edge in edges if cls.SYSTEM_CLIENT not in (_edge.src_client, _edge.dst_client))
+
+    @classmethod
+    def _run_operations(cls, action: str, edges: List[Edge], runner: CommandRunner, max_workers: int,
+                        batch_size: int) -> List[PatchResult]:
+        if not edges:
+            return []
+        import concurrent.futures  # pulls in logging, which would cost the command line a noticeable startup delay
+
+        _batches = [edges[_i:_i + batch_size] for _i in range(0, len(edges), batch_size)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(_batches)))) as _pool:
+            _done = _pool.map(lambda _batch: cls._run_batch(action, _batch, runner), _batches)
+            return [_result for _batch_results in _done for _result in _batch_results]
+
+    @classmethod
+    def _run_batch(cls, action: str, edges: List[Edge], runner: CommandRunner) -> List[PatchResult]:
+        _flag = " -d" if action == "disconnect" else ""
+        _command = "; ".join(
+            f"{cls.ACONNECT_COMMAND}{_flag} {_edge.src_client}:{_edge.src_port} {_edge.dst_client}:{_edge.dst_port}"
+            f" 2>&1; echo {cls.STATUS_MARKER} $?" for _edge in edges)
+
+        try:
+            _, _stdout = runner(_command)
+        except Exception as _error:  # a broken runner fails the whole batch, not the patch
+            return [PatchResult(_edge, action, False, str(_error)) for _edge in edges]
+
+        # Every operation's output is terminated by a "<marker> <exit status>" line
+        _results: List[PatchResult] = []
+        _output: List[str] = []
+        for _line in _stdout.splitlines():
+            if _line.startswith(cls.STATUS_MARKER):
+                if len(_results) < len(edges):
+                    _status = _line[len(cls.STATUS_MARKER):].strip()
+                    _results.append(PatchResult(edges[len(_results)], action, _status == "0", "\n".join(_output)))
+                _output = []
+            else:
+                _output.append(_line)
+
+        _results.extend(PatchResult(_edge, action, False, "No exit status reported")
+                        for _edge in edges[len(_results):])
+        return _results
+
+
+class MidiDevice:
+    __slots__ = ("id", "name", "args", "type", "channels")
+
+    def __init__(self, _id: int, name: str, args: str, _type: int, channels=None):
+        super().__init__()
+        # Setup class attributes
+        if channels is None:
+            channels = []
+        self.id = _id
+        self.name = name
+        self.args = args
+        self.type = DeviceType(_type)
+
+        self.channels = channels
+
+    def __repr__(self):
+        return f"{self.id}: {self.name}, Args: {self.args}, Channels: {self.channels}, Type: {self.type}"
+
+
+instrument.probe(AConnectionHandler, "parse_device_list")
+instrument.probe(AConnectionHandler, "parse_aconnect_output")
+instrument.probe(AConnectionHandler, "acquire_snapshot", "refresh")  # aconnect or procfs read plus parsing
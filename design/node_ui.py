@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+# Form implementation generated from reading ui file 'design/node.ui'
+#
+# Created by: PyQt5 UI code generator 5.15.11
+#
+# WARNING: Any manual changes made to this file will be lost when pyuic5 is
+# run again.  Do not edit this file unless you know what you are doing.
+
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+
+class Ui_MainWindow(object):
+    def setupUi(self, MainWindow):
+        MainWindow.setObjectName("MainWindow")
+        MainWindow.resize(804, 567)
+        MainWindow.setStyleSheet("")
+        self.centralwidget = QtWidgets.QWidget(MainWindow)
+        self.centralwidget.setObjectName("centralwidget")
+        self.gridLayout = QtWidgets.QGridLayout(self.centralwidget)
+        self.gridLayout.setObjectName("gridLayout")
+        self.searchLineEdit = QtWidgets.QLineEdit(self.centralwidget)
+        self.searchLineEdit.setClearButtonEnabled(True)
+        self.searchLineEdit.setObjectName("searchLineEdit")
+        self.gridLayout.addWidget(self.searchLineEdit, 0, 0, 1, 1)
+        self.nodeEditorPlaceHolder = QtWidgets.QFrame(self.centralwidget)
+        self.nodeEditorPlaceHolder.setStyleSheet("")
+        self.nodeEditorPlaceHolder.setFrameShape(QtWidgets.QFrame.StyledPanel)
+        self.nodeEditorPlaceHolder.setFrameShadow(QtWidgets.QFrame.Raised)
+        self.nodeEditorPlaceHolder.setObjectName("nodeEditorPlaceHolder")
+        self.gridLayout_9 = QtWidgets.QGridLayout(self.nodeEditorPlaceHolder)
+        self.gridLayout_9.setObjectName("gridLayout_9")
+        self.gridLayout.addWidget(self.nodeEditorPlaceHolder, 1, 0, 1, 1)
+        MainWindow.setCentralWidget(self.centralwidget)
+        self.statusbar = QtWidgets.QStatusBar(MainWindow)
+        self.statusbar.setObjectName("statusbar")
+        MainWindow.setStatusBar(self.statusbar)
+        self.menubar = QtWidgets.QMenuBar(MainWindow)
+        self.menubar.setGeometry(QtCore.QRect(0, 0, 804, 30))
+        self.menubar.setObjectName("menubar")
+        self.menuFile = QtWidgets.QMenu(self.menubar)
+        self.menuFile.setObjectName("menuFile")
+        self.menuView = QtWidgets.QMenu(self.menubar)
+        self.menuView.setObjectName("menuView")
+        MainWindow.setMenuBar(self.menubar)
+        self.actionOpen = QtWidgets.QAction(MainWindow)
+        self.actionOpen.setObjectName("actionOpen")
+        self.actionExit = QtWidgets.QAction(MainWindow)
+        self.actionExit.setObjectName("actionExit")
+        self.actionSave = QtWidgets.QAction(MainWindow)
+        self.actionSave.setObjectName("actionSave")
+        self.actionSave_as = QtWidgets.QAction(MainWindow)
+        self.actionSave_as.setObjectName("actionSave_as")
+        self.actionLayered_layout = QtWidgets.QAction(MainWindow)
+        self.actionLayered_layout.setObjectName("actionLayered_layout")
+        self.actionForce_layout = QtWidgets.QAction(MainWindow)
+        self.actionForce_layout.setObjectName("actionForce_layout")
+        self.actionInstrumentation = QtWidgets.QAction(MainWindow)
+        self.actionInstrumentation.setCheckable(True)
+        self.actionInstrumentation.setObjectName("actionInstrumentation")
+        self.actionDump_trace = QtWidgets.QAction(MainWindow)
+        self.actionDump_trace.setObjectName("actionDump_trace")
+        self.menuFile.addAction(self.actionSave)
+        self.menuFile.addAction(self.actionSave_as)
+        self.menuFile.addSeparator()
+        self.menuFile.addAction(self.actionOpen)
+        self.menuFile.addSeparator()
+        self.menuFile.addAction(self.actionExit)
+        self.menuView.addAction(self.actionLayered_layout)
+        self.menuView.addAction(self.actionForce_layout)
+        self.menuView.addSeparator()
+        self.menuView.addAction(self.actionInstrumentation)
+        self.menuView.addAction(self.actionDump_trace)
+        self.menubar.addAction(self.menuFile.menuAction())
+        self.menubar.addAction(self.menuView.menuAction())
+
+        self.retranslateUi(MainWindow)
+        QtCore.QMetaObject.connectSlotsByName(MainWindow)
+
+    def retranslateUi(self, MainWindow):
+        _translate = QtCore.QCoreApplication.translate
+        MainWindow.setWindowTitle(_translate("MainWindow", "MainWindow"))
+        self.searchLineEdit.setPlaceholderText(_translate("MainWindow", "Search devices, ports and client ids"))
+        self.menuFile.setTitle(_translate("MainWindow", "File"))
+        self.menuView.setTitle(_translate("MainWindow", "View"))
+        self.actionOpen.setText(_translate("MainWindow", "Open"))
+        self.actionOpen.setShortcut(_translate("MainWindow", "Ctrl+O"))
+        self.actionExit.setText(_translate("MainWindow", "Exit"))
+        self.actionExit.setShortcut(_translate("MainWindow", "Ctrl+Q"))
+        self.actionSave.setText(_translate("MainWindow", "Save"))
+        self.actionSave.setShortcut(_translate("MainWindow", "Ctrl+S"))
+        self.actionSave_as.setText(_translate("MainWindow", "Save as"))
+        self.actionSave_as.setShortcut(_translate("MainWindow", "Ctrl+Shift+S"))
+        self.actionLayered_layout.setText(_translate("MainWindow", "Arrange in columns"))
+        self.actionLayered_layout.setShortcut(_translate("MainWindow", "Ctrl+L"))
+        self.actionForce_layout.setText(_translate("MainWindow", "Arrange by connections"))
+        self.actionForce_layout.setShortcut(_translate("MainWindow", "Ctrl+Shift+L"))
+        self.actionInstrumentation.setText(_translate("MainWindow", "Performance overlay"))
+        self.actionInstrumentation.setShortcut(_translate("MainWindow", "F12"))
+        self.actionDump_trace.setText(_translate("MainWindow", "Save performance trace"))
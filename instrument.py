@@ -0,0 +1,171 @@
+"""
+    Opt-in timing of the hot paths. Modules register their hot functions with probe(), enable() wraps them and
+    disable() puts the originals back, so nothing is measured or wrapped while the layer is off.
+
+    MIDICONNECTOR_INSTRUMENT=1 enables it at startup, MIDICONNECTOR_TRACE=<path> also writes a trace file on exit.
+"""
+import atexit
+import bisect
+import collections
+import functools
+import json
+import os
+import threading
+import time
+import typing
+from typing import Dict, List, Tuple
+
+ENABLE_VARIABLE = "MIDICONNECTOR_INSTRUMENT"
+TRACE_VARIABLE = "MIDICONNECTOR_TRACE"
+
+BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)  # upper bounds, then overflow
+MAX_TRACE_EVENTS = 200000
+FRAME_WINDOW = 1.0  # seconds of frames the FPS and worst frame time are computed over
+
+enabled = False
+
+_lock = threading.Lock()
+_probes: List[Tuple[object, str, str]] = []
+_originals: Dict[Tuple[int, str], object] = {}
+_start = time.perf_counter()
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "total", "worst")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+
+    def add(self, seconds: float):
+        _ms = seconds * 1000
+        self.counts[bisect.bisect_left(BUCKETS_MS, _ms)] += 1
+        self.count += 1
+        self.total += _ms
+        self.worst = max(self.worst, _ms)
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given fraction of samples, in milliseconds"""
+        _needed = fraction * self.count
+        _seen = 0
+        for _bound, _count in zip(BUCKETS_MS, self.counts):
+            _seen += _count
+            if _seen >= _needed:
+                return _bound
+        return self.worst
+
+    def as_dict(self) -> dict:
+        return {"count": self.count, "mean_ms": self.total / self.count if self.count else 0.0,
+                "p50_ms": self.percentile(0.5), "p95_ms": self.percentile(0.95), "worst_ms": self.worst,
+                "buckets_ms": dict(zip([str(_bound) for _bound in BUCKETS_MS] + ["inf"], self.counts))}
+
+
+histograms: Dict[str, Histogram] = collections.defaultdict(Histogram)
+trace: typing.Deque[tuple] = collections.deque(maxlen=MAX_TRACE_EVENTS)  # (name, start, duration, thread id)
+
+# Per frame: calls and seconds spent in each probe since the last end_frame(), and the finished frames
+_frame_calls: typing.Counter[str] = collections.Counter()
+_frame_seconds: typing.Counter[str] = collections.Counter()
+frames: typing.Deque[Tuple[float, float]] = collections.deque()  # (end, duration) within FRAME_WINDOW
+last_frame: Dict[str, Tuple[int, float]] = {}  # probe name -> (calls, seconds) in the last finished frame
+
+
+def record(name: str, start: float, seconds: float):
+    with _lock:
+        histograms[name].add(seconds)
+        _frame_calls[name] += 1
+        _frame_seconds[name] += seconds
+        trace.append((name, start, seconds, threading.get_ident()))
+
+
+def _timed(function, name: str):
+    @functools.wraps(function)
+    def _wrapper(*args, **kwargs):
+        _begin = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record(name, _begin, time.perf_counter() - _begin)
+    return _wrapper
+
+
+def _wrap(owner, attribute: str, name: str):
+    _original = owner.__dict__[attribute]
+    _originals[(id(owner), attribute)] = _original
+    if isinstance(_original, (classmethod, staticmethod)):
+        setattr(owner, attribute, type(_original)(_timed(_original.__func__, name)))
+    else:
+        setattr(owner, attribute, _timed(_original, name))
+
+
+def probe(owner, attribute: str, name: str = None):
+    """Registers owner.attribute, a function defined on the class owner itself, to be timed while enabled"""
+    _name = name or f"{owner.__name__}.{attribute}"
+    _probes.append((owner, attribute, _name))
+    if enabled:
+        _wrap(owner, attribute, _name)
+
+
+def enable():
+    global enabled
+    if enabled:
+        return
+    enabled = True
+    for _owner, _attribute, _name in _probes:
+        _wrap(_owner, _attribute, _name)
+
+
+def disable():
+    global enabled
+    if not enabled:
+        return
+    enabled = False
+    for _owner, _attribute, _ in _probes:
+        setattr(_owner, _attribute, _originals.pop((id(_owner), _attribute)))
+
+
+def end_frame(start: float):
+    """Closes the frame painted since start, moving the per frame counts into last_frame"""
+    _end = time.perf_counter()
+    record("frame", start, _end - start)
+    with _lock:
+        frames.append((_end, _end - start))
+        while frames and frames[0][0] < _end - FRAME_WINDOW:
+            frames.popleft()
+        last_frame.clear()
+        for _name, _calls in _frame_calls.items():
+            if _name != "frame":
+                last_frame[_name] = (_calls, _frame_seconds[_name])
+        _frame_calls.clear()
+        _frame_seconds.clear()
+
+
+def frame_stats() -> Tuple[float, float]:
+    """Frames per second and the worst frame time in milliseconds over the last FRAME_WINDOW"""
+    with _lock:
+        if not frames:
+            return 0.0, 0.0
+        return len(frames) / FRAME_WINDOW, max(_duration for _, _duration in frames) * 1000
+
+
+def summary() -> Dict[str, dict]:
+    with _lock:
+        return {_name: _histogram.as_dict() for _name, _histogram in sorted(histograms.items())}
+
+
+def dump_trace(path: str):
+    """Writes the recorded spans in the Chrome trace event format, readable by chrome://tracing and Perfetto"""
+    with _lock:
+        _events = [{"name": _name, "ph": "X", "ts": (_begin - _start) * 1e6, "dur": _seconds * 1e6,
+                    "pid": os.getpid(), "tid": _thread} for _name, _begin, _seconds, _thread in trace]
+    _events.sort(key=lambda _event: _event["ts"])
+    with open(path, "w", encoding="utf-8") as _file:
+        json.dump({"traceEvents": _events, "displayTimeUnit": "ms", "histograms": summary()}, _file)
+
+
+if os.environ.get(ENABLE_VARIABLE) or os.environ.get(TRACE_VARIABLE):
+    enabled = True  # probes registered from now on are wrapped right away
+if os.environ.get(TRACE_VARIABLE):
+    atexit.register(lambda: dump_trace(os.environ[TRACE_VARIABLE]))
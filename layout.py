@@ -0,0 +1,125 @@
+import typing
+from typing import Tuple
+
+import numpy as np
+
+# Nodes are given as their (width, height) and connections as pairs of node indices, both layouts return the top
+# left corner of every node as an (n, 2) array, with the whole layout centred on (0, 0)
+
+LAYER_GAP = 240.0  # horizontal space between the source and the destination column
+NODE_GAP = 30.0  # vertical space between two nodes of a column
+BAND_GAP = 400.0  # horizontal space between two bands of a long layered layout
+MAX_COLUMN_HEIGHT = 12000.0
+
+
+def _edge_array(edges: typing.Iterable[Tuple[int, int]]) -> np.ndarray:
+    _edges = np.array(list(edges), dtype=np.int64).reshape(-1, 2)
+    return np.unique(_edges, axis=0) if len(_edges) else _edges
+
+
+def _centred(positions: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+    if len(positions):
+        positions -= (positions.min(axis=0) + (positions + sizes).max(axis=0)) / 2
+    return positions
+
+
+def _barycenters(rank: np.ndarray, edges: np.ndarray, own: np.ndarray, count: int) -> np.ndarray:
+    """Mean rank of the neighbours of every node, nodes without neighbours keep their own rank"""
+    _weights = np.bincount(edges[:, 1], minlength=count)
+    _sums = np.bincount(edges[:, 1], weights=rank[edges[:, 0]], minlength=count)
+    return np.where(_weights > 0, _sums / np.maximum(_weights, 1), own)
+
+
+def layered(sizes: np.ndarray, sources: np.ndarray, edges: typing.Iterable[Tuple[int, int]],
+            sweeps: int = 8) -> np.ndarray:
+    """
+        Puts the nodes flagged in sources into the left column and all others into the right one. Both columns are
+        ordered by the barycenter heuristic, which places every node near the nodes it is connected to and so
+        reduces edge crossings.
+    """
+    sizes = np.asarray(sizes, dtype=float).reshape(-1, 2)
+    _count = len(sizes)
+    _sources = np.asarray(sources, dtype=bool)
+    _edges = _edge_array(edges)
+    _reversed = _edges[:, ::-1]
+
+    # Ranks start from the given order, each sweep reorders one column by the ranks of the other
+    _rank = np.zeros(_count)
+    for _column in (_sources, ~_sources):
+        _rank[_column] = np.arange(np.count_nonzero(_column))
+
+    for _sweep in range(sweeps):
+        _column, _edges_into = (~_sources, _edges) if _sweep % 2 == 0 else (_sources, _reversed)
+        _center = _barycenters(_rank, _edges_into, _rank, _count)
+        _members = np.flatnonzero(_column)
+        _rank[_members[np.lexsort((_rank[_members], _center[_members]))]] = np.arange(len(_members))
+
+    # Long columns are cut into bands of equal rank ranges, placed side by side, so both columns of a band still face
+    # the nodes they connect to
+    _bands = max(1, int(np.ceil(max(sizes[_column, 1].sum() + NODE_GAP * np.count_nonzero(_column)
+                                    for _column in (_sources, ~_sources)) / MAX_COLUMN_HEIGHT)))
+    _widths = (sizes[_sources, 0].max(initial=0.0), sizes[~_sources, 0].max(initial=0.0))
+    _band_width = _widths[0] + LAYER_GAP + _widths[1] + BAND_GAP
+
+    _positions = np.zeros((_count, 2))
+    for _column, _x in ((_sources, 0.0), (~_sources, _widths[0] + LAYER_GAP)):
+        _members = np.flatnonzero(_column)
+        _order = _members[np.argsort(_rank[_members], kind="stable")]
+        _band = np.arange(len(_order)) * _bands // max(len(_order), 1)
+        _heights = sizes[_order, 1] + NODE_GAP
+        _tops = np.cumsum(_heights) - _heights
+        _band_start = np.searchsorted(_band, _band, side="left")  # first member of the same band
+        _positions[_order, 0] = _x + _band * _band_width
+        _positions[_order, 1] = _tops - _tops[_band_start]
+    return _centred(_positions, sizes)
+
+
+def force_directed(sizes: np.ndarray, edges: typing.Iterable[Tuple[int, int]], initial: np.ndarray = None,
+                   iterations: int = 15, seed: int = 0) -> np.ndarray:
+    """
+        Fruchterman-Reingold layout: every pair of nodes repels, connected nodes attract, and the step size cools
+        down each iteration. The pairwise repulsion is a handful of (n, n) array operations, so a couple of thousand
+        nodes take well under a second.
+    """
+    _count = len(sizes)
+    if _count == 0:
+        return np.zeros((0, 2))
+    _edges = _edge_array(edges)
+    _edges = _edges[_edges[:, 0] != _edges[:, 1]]
+
+    _sizes = np.asarray(sizes, dtype=np.float32)
+    _ideal = np.float32(np.hypot(*_sizes.mean(axis=0)) + NODE_GAP)  # distance two connected nodes settle at
+    _side = _ideal * np.float32(1.5 * np.sqrt(_count))  # side of the square frame the nodes stay in
+
+    _rng = np.random.default_rng(seed)
+    if initial is None:
+        _centers = _rng.uniform(0, _side, (_count, 2)).astype(np.float32)
+    else:  # jittered, nodes piled onto one spot would never separate
+        _centers = (np.asarray(initial) + _sizes / 2 + _rng.uniform(-1, 1, (_count, 2))).astype(np.float32)
+
+    _temperature = _side / 10
+    _cooling = _temperature / (iterations + 1)
+    for _ in range(iterations):
+        _centers -= _centers.mean(axis=0)  # keeps the squares below small enough for float32
+
+        # |p_i - p_j|^2 through the Gram matrix, then repulsion k^2 / d along (p_i - p_j) / d summed over j
+        _squares = np.einsum("ij,ij->i", _centers, _centers)
+        _weights = _squares[:, None] + _squares[None, :]
+        _weights -= 2 * (_centers @ _centers.T)
+        np.maximum(_weights, 1.0, out=_weights)
+        np.divide(_ideal * _ideal, _weights, out=_weights)
+        _displacement = _centers * _weights.sum(axis=1, keepdims=True) - _weights @ _centers
+
+        # attraction d^2 / k along the edges, pulling both ends together
+        if len(_edges):
+            _pull = _centers[_edges[:, 0]] - _centers[_edges[:, 1]]
+            _pull *= np.linalg.norm(_pull, axis=1, keepdims=True) / _ideal
+            np.subtract.at(_displacement, _edges[:, 0], _pull)
+            np.add.at(_displacement, _edges[:, 1], _pull)
+
+        _length = np.maximum(np.linalg.norm(_displacement, axis=1, keepdims=True), 1e-3)
+        _centers += _displacement / _length * np.minimum(_length, _temperature)
+        np.clip(_centers, -_side / 2, _side / 2, out=_centers)  # the frame, without it the layout keeps expanding
+        _temperature -= _cooling
+
+    return _centred((_centers - _sizes / 2).astype(np.float64), _sizes)
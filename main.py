@@ -1,103 +1,431 @@
 import os
-import pickle
-import random
 import sys
-from typing import List, Optional
+from typing import List, Optional, Set, Tuple, Dict, Iterator
+
+import cli
+import instrument
+
+# Command line use never loads Qt
+if __name__ == '__main__' and cli.is_command(sys.argv[1:]):
+    sys.exit(cli.main(sys.argv[1:]))
 
 from PyQt5 import uic
-from PyQt5.QtCore import QFile
-from PyQt5.QtWidgets import QMainWindow, QApplication, QFrame, QWidget, QAction, QFileDialog
+from PyQt5.QtCore import QFile, QTimer, QPointF, QElapsedTimer
+from PyQt5.QtWidgets import QMainWindow, QApplication, QFrame, QWidget, QAction, QFileDialog, QLineEdit
 
+import scenefile
+import search
 import utils
 
+try:
+    from design.node_ui import Ui_MainWindow  # pyuic5 design/node.ui -o design/node_ui.py
+except ImportError:
+    Ui_MainWindow = None
+
 GUI_PATH = "design/node.ui"
+REFRESH_INTERVAL_MS = 2000
 GLOBAL_QSS_PATH = "design/style/main.qss"
 
-SAVE_FILE_SEPARATOR = b"$NODE_ENDINGBRUHURHURUHU"
+SCENE_FILE_FILTER = f"MidiConnector scenes (*{scenefile.EXTENSION})"
+TRACE_FILE_FILTER = "Chrome trace (*.json)"
+LOAD_BATCH_SIZE = 50  # nodes created per event loop iteration while a scene streams in
+MOVE_JOURNAL_DELAY_MS = 250  # moves are written once a drag settled, not for every mouse move
+COMPACT_INTERVAL_MS = 30000
+LAYERED_LAYOUT = "layered"
+FORCE_LAYOUT = "force"
+
+SEARCH_DIMMED_OPACITY = 0.2  # nodes not matching the search box
+
+NODE_BATCH_BUDGET_MS = 8  # time spent creating new nodes per event loop iteration, keeps the window responsive
 
 
 class UI(QMainWindow):
     def __init__(self):
         super().__init__()
 
-        # Load Graphics
-        uic.loadUi(GUI_PATH, self)
+        # Load Graphics, the generated class saves parsing the .ui file at every start
+        if Ui_MainWindow is not None:
+            Ui_MainWindow().setupUi(self)
+        else:
+            uic.loadUi(GUI_PATH, self)
 
         # Init components
         self.node_editor_place_holder: QFrame = self.findChild(QFrame, "nodeEditorPlaceHolder")
+        self.search_line_edit: QLineEdit = self.findChild(QLineEdit, "searchLineEdit")
 
         self.open_action: QAction = self.findChild(QAction, "actionOpen")
         self.save_action: QAction = self.findChild(QAction, "actionSave")
         self.save_as_action: QAction = self.findChild(QAction, "actionSave_as")
         self.exit_action: QAction = self.findChild(QAction, "actionExit")
+        self.layered_layout_action: QAction = self.findChild(QAction, "actionLayered_layout")
+        self.force_layout_action: QAction = self.findChild(QAction, "actionForce_layout")
+        self.instrumentation_action: QAction = self.findChild(QAction, "actionInstrumentation")
+        self.dump_trace_action: QAction = self.findChild(QAction, "actionDump_trace")
 
         self.open_action.triggered.connect(self.open)
-        self.open_action.setStatusTip("Open a save folder")
+        self.open_action.setStatusTip("Open a scene file")
         self.save_action.triggered.connect(self.save)
         self.save_action.setStatusTip("Save scene")
         self.save_as_action.triggered.connect(self.save_as)
         self.save_as_action.setStatusTip("Save scene to location")
         self.exit_action.triggered.connect(sys.exit)
         self.exit_action.setStatusTip("Quit?")
+        self.layered_layout_action.triggered.connect(lambda: self.auto_layout(LAYERED_LAYOUT))
+        self.layered_layout_action.setStatusTip("Sources on the left, destinations on the right")
+        self.force_layout_action.triggered.connect(lambda: self.auto_layout(FORCE_LAYOUT))
+        self.force_layout_action.setStatusTip("Keep connected devices close to each other")
+        self.instrumentation_action.setChecked(instrument.enabled)
+        self.instrumentation_action.toggled.connect(self.set_instrumented)
+        self.instrumentation_action.setStatusTip("Time the hot paths and show frame times over the scene")
+        self.dump_trace_action.triggered.connect(self.dump_trace)
+        self.dump_trace_action.setStatusTip("Save the recorded timings for chrome://tracing or Perfetto")
+        self.search_line_edit.textChanged.connect(lambda: self.filter_nodes(centre=True))
 
         self.input_devices = []
         self.output_devices = []
         self.devices = []
         self.connections = []
+        self.graph = utils.ConnectionGraph()
 
         self.connections_view: Optional[utils.QDMNodeEditor] = None
 
         self.nodes: List[utils.Node] = []
+        self.edges: Dict[utils.Edge, utils.QDMGraphicsEdge] = {}
+        self.removed_nodes: Set[Tuple[int, int]] = set()  # keys of nodes the user deleted
+        self.last_positions: Dict[Tuple[int, int], QPointF] = {}  # where vanished devices were last seen
+        self.scene_keys: Set[Tuple[int, int]] = set()  # nodes of current_file, kept while their device is offline
+        self.scene_edges: Set[utils.Edge] = set()  # connections of current_file, the live ones may differ
+        self.search_index = search.SearchIndex()  # covers the devices of all nodes, also of those from a scene file
 
         self.current_file = None
+        self._load_batches: Optional[Iterator[list]] = None
+        self._load_generation = 0  # batches queued by an earlier load stop once a newer one started
+        self._pending_devices: Dict[Tuple[int, int], utils.MidiDevice] = {}  # devices still waiting for a node
+
+        # Autosave: every edit of the user is appended to the journal of current_file, which is folded into it
+        # periodically. Devices and connections coming and going are not edits and are not journaled.
+        self.journal: Optional[scenefile.SceneJournal] = None
+        self._moved_nodes: Set[utils.Node] = set()
+        self._move_timer = QTimer(self)
+        self._move_timer.setSingleShot(True)
+        self._move_timer.timeout.connect(self.journal_moves)
+        self._compact_timer = QTimer(self)
+        self._compact_timer.timeout.connect(self.compact_journal)
+        self._compact_timer.start(COMPACT_INTERVAL_MS)
+
+        # The topology is acquired off the GUI thread, nodes are added once it arrives
+        self.refresher = utils.TopologyRefreshWorker()
+        self.refresher.snapshot_ready.connect(self.on_snapshot)
+        self.refresher.refresh_failed.connect(lambda _error: self.statusBar().showMessage(f"Refresh failed: {_error}"))
+        QApplication.instance().aboutToQuit.connect(self.refresher.stop)
+        QApplication.instance().aboutToQuit.connect(self.close_journal)
 
-        self.init_lists()
         self.init_node_editor()
         self.init_ui()
 
+        self.refresher.request_refresh()
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresher.request_refresh)
+        self.refresh_timer.start(REFRESH_INTERVAL_MS)
+
     def restart(self):
-        self.connections_view.scene.clear()
-        self.nodes.clear()
-        self.node_editor_place_holder.layout().removeWidget(self.connections_view)
-        self.init_node_editor()
+        self.removed_nodes.clear()
+        self.reconcile(self.devices)
+        self.refresher.request_refresh()
 
     def open(self):
-        self.nodes.clear()
-        self.connections_view.scene.clear()
-        self.load()
-
-    def load(self):
-        url = QFileDialog.getExistingDirectoryUrl(self).url().replace("file://", "")
-        for _file in os.listdir(url):
-            _data = pickle.load(open(f"{url}/{_file}", "rb"))
-            self.nodes.append(utils.Node(_data[0], self.connections_view, _data[1]))
+        _path = QFileDialog.getOpenFileName(self, "Open scene", "", SCENE_FILE_FILTER)[0]
+        if _path:
+            self.load(_path)
+
+    def load(self, path: str):
+        """
+            Moves the nodes already on screen to their saved positions, then streams in the missing ones. Nodes of
+            devices that are not connected stay as placeholders until they come back or are deleted.
+        """
+        try:
+            if scenefile.recover(path):  # edits journaled before a crash
+                self.statusBar().showMessage(f"Recovered unsaved changes of {path}")
+            _positions = scenefile.read_index(path)
+        except (OSError, scenefile.SceneFormatError) as _error:
+            self.statusBar().showMessage(f"Could not open {path}: {_error}")
+            return
+
+        self.close_journal()
+        self.current_file = path
+        self.removed_nodes.clear()
+        self.scene_keys = set(_positions)
+        self.scene_edges = set()  # streamed in along with the nodes
+        for _node in self.nodes:
+            if _node.key in _positions:
+                _node.setPos(QPointF(*_positions[_node.key]))
+        self.start_journal()
+
+        self._load_generation += 1
+        self._load_batches = scenefile.batched(scenefile.iter_records(path), LOAD_BATCH_SIZE)
+        self.load_next_batch(self._load_generation)
+
+    def load_next_batch(self, generation: int):
+        if self._load_batches is None or generation != self._load_generation:
+            return
+        try:
+            _batch = next(self._load_batches, None)
+        except (OSError, scenefile.SceneFormatError) as _error:
+            self.statusBar().showMessage(f"Could not open {self.current_file}: {_error}")
+            _batch = None
+        if _batch is None:
+            self._load_batches = None
+            return
+
+        _existing = {_node.key for _node in self.nodes}
+        for _record in _batch:
+            if isinstance(_record, scenefile.EdgeRecord):
+                self.scene_edges.add(utils.Edge(*_record))
+            elif _record.key not in _existing:
+                # a live device still waiting for its node is placed where the scene has it
+                _device = self._pending_devices.pop(_record.key, None) or utils.MidiDevice(
+                    _record.client, _record.name, _record.args, _record.type,
+                    [utils.Port(_port, _name, _record.client) for _port, _name in _record.ports])
+                self.nodes.append(utils.Node(_device, self.connections_view, QPointF(_record.x, _record.y)))
+                self.search_index.add(_device)
+        self.update_nodes()
+        self.update_edges()
+        self.filter_nodes()
 
-            self.update_nodes()
+        QTimer.singleShot(0, lambda: self.load_next_batch(generation))
 
     def save(self):
-        if self.current_file:
-            pass
+        # Everything since the last full write is already in the journal, only what Save adds has to follow
+        if self.journal is not None:
+            self.journal_scene()
+            self.journal.sync()
+        elif self.current_file:
+            self.write_scene(self.current_file)
+            self.start_journal()
         else:
             self.save_as()
 
-    def save_as(self):  # TODO: figure out how to deal with connections once they are implemented
-        url = QFileDialog.getSaveFileUrl(self)[0].url().replace("file://", "")
-        os.mkdir(url)
-        for _each in self.nodes:
-            with open(f"{url}/{_each.device.name}-{_each.device.type}", "wb") as _file:
-                pickle.dump([_each.device, _each.pos()], _file)
-                pickle.dump(SAVE_FILE_SEPARATOR, _file)
+    def save_as(self):
+        _path = QFileDialog.getSaveFileName(self, "Save scene", "", SCENE_FILE_FILTER)[0]
+        if not _path:
+            return
+        if not _path.endswith(scenefile.EXTENSION):
+            _path += scenefile.EXTENSION
+        self.close_journal()
+        self.write_scene(_path)
+        self.current_file = _path
+        self.start_journal()
+
+    def set_instrumented(self, enabled: bool):
+        if enabled:
+            instrument.enable()
+        else:
+            instrument.disable()
+        self.connections_view.show_overlay(enabled)
+
+    def dump_trace(self):
+        _path = QFileDialog.getSaveFileName(self, "Save performance trace", "", TRACE_FILE_FILTER)[0]
+        if not _path:
+            return
+        instrument.dump_trace(_path)
+        self.statusBar().showMessage(f"Saved {len(instrument.trace)} timings to {_path}")
+
+    @staticmethod
+    def node_record(node: utils.Node) -> scenefile.NodeRecord:
+        return scenefile.NodeRecord(node.device.id, node.device.type.value, node.device.name, node.device.args,
+                                    [(_channel[0], _channel[1]) for _channel in node.device.channels],
+                                    node.x(), node.y())
+
+    def scene_records(self) -> Tuple[List[scenefile.NodeRecord], List[scenefile.EdgeRecord]]:
+        return [self.node_record(_node) for _node in self.nodes if _node.key in self.scene_keys], \
+            [scenefile.EdgeRecord(*_edge) for _edge in sorted(self.scene_edges)]
+
+    def capture_scene(self):
+        """Makes every node on screen and the live connections part of the scene, keeping those of offline devices"""
+        _live = {_device.id for _device in self.devices}
+        self.scene_keys = {_node.key for _node in self.nodes}
+        self.scene_edges = set(self.graph) | {_edge for _edge in self.scene_edges
+                                              if _edge.src_client not in _live or _edge.dst_client not in _live}
+
+    def write_scene(self, path: str):
+        self.capture_scene()
+        scenefile.save_scene(path, *self.scene_records())
+        if os.path.exists(path + scenefile.JOURNAL_SUFFIX):  # left from an earlier session, the full write covers it
+            os.remove(path + scenefile.JOURNAL_SUFFIX)
+
+    def journal_scene(self):
+        """Journals what capture_scene() changes, so Save appends the difference instead of writing the scene"""
+        self.journal_moves()
+        _keys, _edges = self.scene_keys, self.scene_edges
+        self.capture_scene()
+        for _key in _keys - self.scene_keys:
+            self.journal.record_remove(_key)
+        for _node in self.nodes:
+            if _node.key not in _keys:
+                self.journal.record_add(self.node_record(_node))
+        for _edge in sorted(_edges - self.scene_edges):
+            self.journal.record_disconnect(scenefile.EdgeRecord(*_edge))
+        for _edge in sorted(self.scene_edges - _edges):
+            self.journal.record_connect(scenefile.EdgeRecord(*_edge))
+
+    def start_journal(self):
+        self.journal = scenefile.SceneJournal(self.current_file)
+
+    def close_journal(self):
+        if self.journal is not None:
+            self.journal_moves()
+            self.journal.close()
+            self.journal = None
+
+    def compact_journal(self):
+        if self.journal is not None and self.journal.pending and self._load_batches is None:
+            self.journal_moves()
+            self.journal.compact(*self.scene_records())
+
+    def node_moved(self, node: utils.Node):
+        if self.journal is None:
+            return
+        self._moved_nodes.add(node)
+        if not self._move_timer.isActive():
+            self._move_timer.start(MOVE_JOURNAL_DELAY_MS)
+
+    def journal_moves(self):
+        _moved, self._moved_nodes = self._moved_nodes, set()
+        if self.journal is None:
+            return
+        for _node in _moved:
+            if _node.scene() is None:
+                continue
+            if _node.key in self.scene_keys:
+                self.journal.record_move(_node.key, _node.x(), _node.y())
+            else:  # placing a node that is not saved yet adds it to the scene
+                self.scene_keys.add(_node.key)
+                self.journal.record_add(self.node_record(_node))
+
+    def add_node(self, node: utils.Node):
+        self.nodes.append(node)
+        self.search_index.add(node.device)
+
+    def delete_node(self, node: utils.Node):
+        """Removes a node on the user's request, it stays away until restart() and leaves the scene"""
+        self.removed_nodes.add(node.key)
+        if self.journal is not None and node.key in self.scene_keys:
+            self.journal.record_remove(node.key)
+        self.remove_node(node)
+
+    def remove_node(self, node: utils.Node):
+        self.last_positions[node.key] = node.pos()
+        self.nodes.remove(node)
+        self.scene_keys.discard(node.key)
+        self._moved_nodes.discard(node)
+        node.detach_edges()
+        self.connections_view.scene.removeItem(node)
+
+    def reconcile(self, devices: List[utils.MidiDevice]):
+        """
+            Updates and removes only the nodes whose device differs, existing nodes keep position and selection.
+            Nodes for new devices are created in timed batches by add_pending_nodes.
+        """
+        _existing = {_node.key: _node for _node in self.nodes}
+        _wanted = {utils.Node.device_key(_device): _device for _device in devices}
+        _wanted = {_key: _device for _key, _device in _wanted.items() if _key not in self.removed_nodes}
+
+        for _key, _node in _existing.items():
+            if _key not in _wanted and _key not in self.scene_keys:
+                self.remove_node(_node)
+
+        _was_pending = bool(self._pending_devices)
+        self._pending_devices = {}
+        for _key, _device in _wanted.items():
+            _node = _existing.get(_key)
+            if _node is None:
+                self._pending_devices[_key] = _device
+            else:
+                _node.set_device(_device)
+
+        self.update_edges()
+        if self.search_index.update(_node.device for _node in self.nodes):
+            self.filter_nodes()
+        if self._pending_devices and not _was_pending:
+            QTimer.singleShot(0, self.add_pending_nodes)
+
+    def add_pending_nodes(self):
+        _timer = QElapsedTimer()
+        _timer.start()
+        _nodes = []
+        while self._pending_devices and not _timer.hasExpired(NODE_BATCH_BUDGET_MS):
+            _key = next(iter(self._pending_devices))
+            _device = self._pending_devices.pop(_key)
+            _node = utils.Node(_device, self.connections_view, self.last_positions.pop(_key, None))
+            self.add_node(_node)
+            _nodes.append(_node)
+
+        self.connections_view.scene.add_items(_nodes)
+        self.update_edges()
+        self.filter_nodes()
+        if self._pending_devices:
+            QTimer.singleShot(0, self.add_pending_nodes)
+
+    def filter_nodes(self, centre: bool = False):
+        """Dims the nodes not matching the search box, optionally centring the view on the best match"""
+        _query = self.search_line_edit.text()
+        if not _query.strip() and not centre:  # nothing dimmed, nothing to restore
+            return
+        _matches = self.search_index.search(_query)
+        _matched = set(_matches)
+
+        _nodes = {}
+        for _node in self.nodes:
+            _nodes[_node.key] = _node
+            _opacity = 1.0 if not _query.strip() or _node.key in _matched else SEARCH_DIMMED_OPACITY
+            if _node.opacity() != _opacity:
+                _node.setOpacity(_opacity)
+
+        if centre:
+            _best = next((_nodes[_key] for _key in _matches if _key in _nodes), None)
+            if _best is not None:
+                self.connections_view.centerOn(_best)
+
+    def auto_layout(self, mode: str):
+        try:
+            import layout  # numpy takes a while to import, so only once a layout is asked for
+        except ImportError as _error:
+            self.statusBar().showMessage(f"Auto layout needs numpy: {_error}")
+            return
+        if not self.nodes:
+            return
+
+        _index = {_node.key: _i for _i, _node in enumerate(self.nodes)}
+        _sizes = [(_node.width, _node.height) for _node in self.nodes]
+        _edges = [(_index[_src], _index[_dst]) for _src, _dst in
+                  (((_edge.src_client, utils.DeviceType.input), (_edge.dst_client, utils.DeviceType.output))
+                   for _edge in self.graph) if _src in _index and _dst in _index]
+
+        if mode == LAYERED_LAYOUT:
+            # Connections leave input devices on the right, so those make up the left column
+            _positions = layout.layered(_sizes, [_node.device.type.value == utils.DeviceType.input
+                                                 for _node in self.nodes], _edges)
+        else:
+            _positions = layout.force_directed(_sizes, _edges, initial=[(_node.x(), _node.y()) for _node in self.nodes])
+
+        self.connections_view.scene.move_nodes({_node: QPointF(*_position)
+                                                for _node, _position in zip(self.nodes, _positions.tolist())})
 
     def init_ui(self):
         self.show()
 
-    def init_lists(self):
-        self.input_devices = utils.AConnectionHandler.get_input_devices()
-        self.output_devices = utils.AConnectionHandler.get_output_devices()
-        self.connections = utils.AConnectionHandler.get_connections()
+    def init_lists(self, snapshot: utils.TopologySnapshot):
+        self.input_devices = list(snapshot.input_devices)
+        self.output_devices = list(snapshot.output_devices)
+        self.connections = list(snapshot.connections)
+        self.graph = snapshot.graph
 
-        self.devices.extend(self.input_devices)
-        self.devices.extend(self.output_devices)
+        self.devices = self.input_devices + self.output_devices
+
+    def on_snapshot(self, snapshot: utils.TopologySnapshot):
+        self.init_lists(snapshot)
+        self.reconcile(self.devices)
 
     def init_node_editor(self):
         self.connections_view = utils.QDMNodeEditor(self.node_editor_place_holder,
@@ -109,20 +437,42 @@ class UI(QMainWindow):
         self.update_nodes()
 
     def update_nodes(self):
-        for _each in self.nodes:
-            if _each not in self.connections_view.scene.items():
-                self.connections_view.scene.addItem(_each)
+        self.connections_view.scene.add_items(self.nodes)
+
+    def update_edges(self):
+        """Creates the edges of new connections and drops those of vanished connections or sockets"""
+        for _edge, _item in list(self.edges.items()):
+            if _edge not in self.graph or _item.scene() is None:
+                _item.detach()
+                del self.edges[_edge]
+
+        _nodes = {_node.key: _node for _node in self.nodes}
+        _new = []
+        for _edge in self.graph:
+            if _edge in self.edges:
+                continue
+            _start = _nodes.get((_edge.src_client, utils.DeviceType.input))
+            _end = _nodes.get((_edge.dst_client, utils.DeviceType.output))
+            if _start is None or _end is None or _edge.src_port not in _start.sockets \
+                    or _edge.dst_port not in _end.sockets:
+                continue
+            self.edges[_edge] = utils.QDMGraphicsEdge(_edge, _start, _end)
+            _new.append(self.edges[_edge])
+
+        self.connections_view.scene.add_items(_new)
 
 
 if __name__ == '__main__':
     # Run App
     app = QApplication(sys.argv)
-    ui = UI()
 
-    # Global Style
+    # Global Style, set before the first widget exists so nothing gets styled twice
     file = QFile(GLOBAL_QSS_PATH)
     file.open(QFile.ReadOnly | QFile.Text)
     style_sheet = str(file.readAll(), encoding='utf-8')
     app.setStyleSheet(style_sheet)
 
+    # The window shows up empty, nodes are added in batches once the first snapshot arrives
+    ui = UI()
+
     sys.exit(app.exec_())
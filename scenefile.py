@@ -0,0 +1,327 @@
+import itertools
+import json
+import os
+import threading
+import typing
+from typing import List, NamedTuple, Tuple
+
+FORMAT = "midiconnector-scene"
+VERSION = 1
+EXTENSION = ".mcscene"
+
+# Layout, one JSON value per line:
+#   {"format": "midiconnector-scene", "version": 1, "nodes": N, "connections": M,
+#    "journal_sequence": S}                                                          header
+#   [[client, type, x, y], ...]                                                     index of node positions
+#   ["node", client, type, name, args, [[port, name], ...]]                         N node records
+#   ["edge", src_client, src_port, dst_client, dst_port]                            M connection records
+
+NODE = "node"
+EDGE = "edge"
+
+JOURNAL_SUFFIX = ".journal"
+
+# Journal entries, one JSON list per line, appended next to the scene file:
+#   [sequence, "move", client, type, x, y]
+#   [sequence, "add", client, type, name, args, [[port, name], ...], x, y]
+#   [sequence, "remove", client, type]
+#   [sequence, "connect" | "disconnect", src_client, src_port, dst_client, dst_port]
+MOVE = "move"
+ADD = "add"
+REMOVE = "remove"
+CONNECT = "connect"
+DISCONNECT = "disconnect"
+
+
+class SceneFormatError(ValueError):
+    pass
+
+
+class NodeRecord(NamedTuple):
+    client: int
+    type: int
+    name: str
+    args: str
+    ports: List[Tuple[int, str]]
+    x: float = 0.0
+    y: float = 0.0
+
+    @property
+    def key(self) -> Tuple[int, int]:
+        return self.client, self.type
+
+
+class EdgeRecord(NamedTuple):
+    src_client: int
+    src_port: int
+    dst_client: int
+    dst_port: int
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def write_scene(file: typing.TextIO, nodes: typing.Sequence[NodeRecord], edges: typing.Sequence[EdgeRecord],
+                journal_sequence: int = 0):
+    """journal_sequence is the last journal entry already contained in the scene"""
+    file.write(_dumps({"format": FORMAT, "version": VERSION, "nodes": len(nodes), "connections": len(edges),
+                       "journal_sequence": journal_sequence}))
+    file.write("\n")
+    file.write(_dumps([[_node.client, _node.type, _node.x, _node.y] for _node in nodes]))
+    file.write("\n")
+    for _node in nodes:
+        file.write(_dumps([NODE, _node.client, _node.type, _node.name, _node.args,
+                           [[_port, _name] for _port, _name in _node.ports]]))
+        file.write("\n")
+    for _edge in edges:
+        file.write(_dumps([EDGE, _edge.src_client, _edge.src_port, _edge.dst_client, _edge.dst_port]))
+        file.write("\n")
+
+
+def save_scene(path: str, nodes: typing.Sequence[NodeRecord], edges: typing.Sequence[EdgeRecord],
+               journal_sequence: int = 0):
+    """Writes the scene next to path first and swaps it in, so a crash never leaves a half written file"""
+    _temp_path = f"{path}.tmp"
+    with open(_temp_path, "w", encoding="utf-8") as _file:
+        write_scene(_file, nodes, edges, journal_sequence)
+        _file.flush()
+        os.fsync(_file.fileno())
+    os.replace(_temp_path, path)
+
+
+def _read_header(file: typing.TextIO) -> dict:
+    try:
+        _header = json.loads(file.readline())
+    except ValueError as _error:
+        raise SceneFormatError(f"{file.name} is not a scene file") from _error
+    if not isinstance(_header, dict) or _header.get("format") != FORMAT:
+        raise SceneFormatError(f"{file.name} is not a scene file")
+    if _header.get("version", 0) > VERSION:
+        raise SceneFormatError(f"{file.name} was written by a newer version (format version {_header['version']})")
+    return _header
+
+
+def read_header(path: str) -> dict:
+    with open(path, encoding="utf-8") as _file:
+        return _read_header(_file)
+
+
+def _read_index(file: typing.TextIO) -> typing.Dict[Tuple[int, int], Tuple[float, float]]:
+    try:
+        _index = json.loads(file.readline())
+        if not isinstance(_index, list):
+            raise ValueError("not a list")
+        return {(_entry[0], _entry[1]): (_entry[2], _entry[3]) for _entry in _index}
+    except (ValueError, TypeError, IndexError, KeyError) as _error:
+        raise SceneFormatError(f"{file.name}:2: broken position index") from _error
+
+
+def read_index(path: str) -> typing.Dict[Tuple[int, int], Tuple[float, float]]:
+    """Returns the node positions keyed by (client, type) without reading any node record"""
+    with open(path, encoding="utf-8") as _file:
+        _read_header(_file)
+        return _read_index(_file)
+
+
+def iter_records(path: str) -> typing.Iterator[typing.Union[NodeRecord, EdgeRecord]]:
+    """Yields the node records, with their indexed positions, followed by the edge records one line at a time"""
+    with open(path, encoding="utf-8") as _file:
+        _read_header(_file)
+        _positions = _read_index(_file)
+
+        for _line_number, _line in enumerate(_file, 3):
+            if not _line.strip():
+                continue
+            # Unknown record kinds and fields after the known ones are skipped so older versions can still open
+            # newer files
+            try:
+                _record = json.loads(_line)
+                if not isinstance(_record, list) or not _record:
+                    raise ValueError("not a record")
+                if _record[0] == NODE:
+                    _client, _type, _name, _args, _ports = _record[1:6]
+                    _x, _y = _positions.get((_client, _type), (0.0, 0.0))
+                    _parsed = NodeRecord(_client, _type, _name, _args,
+                                         [(_port, _port_name) for _port, _port_name in _ports], _x, _y)
+                elif _record[0] == EDGE:
+                    _parsed = EdgeRecord(*_record[1:5])
+                else:
+                    continue
+            except (ValueError, TypeError) as _error:
+                raise SceneFormatError(f"{path}:{_line_number}: broken record") from _error
+            yield _parsed
+
+
+def load_scene(path: str) -> Tuple[List[NodeRecord], List[EdgeRecord]]:
+    _nodes, _edges = [], []
+    for _record in iter_records(path):
+        (_nodes if isinstance(_record, NodeRecord) else _edges).append(_record)
+    return _nodes, _edges
+
+
+def _read_journal(path: str, after: int) -> typing.Iterator[list]:
+    try:
+        _file = open(path, encoding="utf-8")
+    except FileNotFoundError:
+        return
+    with _file:
+        for _line in _file:
+            try:
+                _entry = json.loads(_line)
+            except ValueError:  # a line torn by a crash ends the journal
+                return
+            if not isinstance(_entry, list) or len(_entry) < 2 or not isinstance(_entry[0], int):
+                return
+            if _entry[0] > after:
+                yield _entry
+
+
+def replay(path: str) -> Tuple[List[NodeRecord], List[EdgeRecord], int]:
+    """Loads the scene and applies the journal entries it does not contain yet, returns the last sequence applied"""
+    _header = read_header(path)
+    _sequence = _header.get("journal_sequence", 0)
+    _nodes_list, _edges_list = load_scene(path)
+    _nodes = {_node.key: _node for _node in _nodes_list}
+    _edges = dict.fromkeys(_edges_list)
+
+    for _entry in _read_journal(path + JOURNAL_SUFFIX, _sequence):
+        try:
+            _sequence = _apply_entry(_entry, _nodes, _edges)
+        except (ValueError, TypeError, IndexError) as _error:
+            raise SceneFormatError(f"{path}{JOURNAL_SUFFIX}: broken entry {_entry!r}") from _error
+
+    return list(_nodes.values()), list(_edges), _sequence
+
+
+def _apply_entry(entry: list, nodes: typing.Dict[Tuple[int, int], NodeRecord],
+                 edges: typing.Dict[EdgeRecord, None]) -> int:
+    """Applies one journal entry to the nodes and edges of a scene, returns its sequence number"""
+    _sequence, _kind, _values = entry[0], entry[1], entry[2:]
+    if _kind == MOVE:
+        _key = (_values[0], _values[1])
+        if _key in nodes:
+            nodes[_key] = nodes[_key]._replace(x=_values[2], y=_values[3])
+    elif _kind == ADD:
+        _client, _type, _name, _args, _ports, _x, _y = _values[:7]
+        nodes[(_client, _type)] = NodeRecord(_client, _type, _name, _args, [tuple(_port) for _port in _ports],
+                                             _x, _y)
+    elif _kind == REMOVE:
+        nodes.pop((_values[0], _values[1]), None)
+    elif _kind == CONNECT:
+        edges[EdgeRecord(*_values[:4])] = None
+    elif _kind == DISCONNECT:
+        edges.pop(EdgeRecord(*_values[:4]), None)
+    return _sequence
+
+
+def recover(path: str) -> bool:
+    """Folds a leftover journal into the scene file, returns whether there was anything to fold in"""
+    _header = read_header(path)
+    _pending = next(_read_journal(path + JOURNAL_SUFFIX, _header.get("journal_sequence", 0)), None)
+    if _pending is not None:
+        _nodes, _edges, _sequence = replay(path)
+        save_scene(path, _nodes, _edges, _sequence)
+    if os.path.exists(path + JOURNAL_SUFFIX):
+        os.remove(path + JOURNAL_SUFFIX)
+    return _pending is not None
+
+
+class SceneJournal:
+    """
+        Append-only log of edits to a scene file. Appending costs one line per edit, compact() folds the log back
+        into the scene file on a background thread.
+    """
+
+    def __init__(self, scene_path: str):
+        self.scene_path = scene_path
+        self.path = scene_path + JOURNAL_SUFFIX
+
+        self._lock = threading.Lock()
+        self._compacting = False
+        self._thread: typing.Optional[threading.Thread] = None
+        self.sequence = read_header(scene_path).get("journal_sequence", 0)
+        for _entry in _read_journal(self.path, self.sequence):
+            self.sequence = _entry[0]
+        self._file = open(self.path, "a", encoding="utf-8")
+        self.pending = 0  # entries written since the last compaction
+
+    def _append(self, *values):
+        with self._lock:
+            self.sequence += 1
+            self._file.write(_dumps([self.sequence, *values]))
+            self._file.write("\n")
+            self._file.flush()
+            self.pending += 1
+
+    def record_move(self, key: Tuple[int, int], x: float, y: float):
+        self._append(MOVE, key[0], key[1], x, y)
+
+    def record_add(self, node: NodeRecord):
+        self._append(ADD, node.client, node.type, node.name, node.args,
+                     [[_port, _name] for _port, _name in node.ports], node.x, node.y)
+
+    def record_remove(self, key: Tuple[int, int]):
+        self._append(REMOVE, key[0], key[1])
+
+    def record_connect(self, edge: EdgeRecord):
+        self._append(CONNECT, *edge)
+
+    def record_disconnect(self, edge: EdgeRecord):
+        self._append(DISCONNECT, *edge)
+
+    def sync(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def compact(self, nodes: typing.Sequence[NodeRecord], edges: typing.Sequence[EdgeRecord],
+                background: bool = True) -> typing.Optional[threading.Thread]:
+        """
+            Writes nodes and edges, the current state of the scene, as the new scene file and drops the entries it
+            covers from the journal. Entries appended while the snapshot is written are kept.
+        """
+        with self._lock:
+            if self._compacting:
+                return None
+            self._compacting = True
+            _sequence = self.sequence
+
+        if not background:
+            self._compact(list(nodes), list(edges), _sequence)
+            return None
+        self._thread = threading.Thread(target=self._compact, args=(list(nodes), list(edges), _sequence), daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def _compact(self, nodes: List[NodeRecord], edges: List[EdgeRecord], sequence: int):
+        try:
+            save_scene(self.scene_path, nodes, edges, sequence)
+            with self._lock:
+                self._file.close()
+                _remaining = list(_read_journal(self.path, sequence))
+                with open(f"{self.path}.tmp", "w", encoding="utf-8") as _file:
+                    for _entry in _remaining:
+                        _file.write(_dumps(_entry))
+                        _file.write("\n")
+                os.replace(f"{self.path}.tmp", self.path)
+                self._file = open(self.path, "a", encoding="utf-8")
+                self.pending = len(_remaining)
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def close(self):
+        # A compaction still writing would reopen the journal and replace it after the caller moved on
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            self._file.close()
+
+
+def batched(records: typing.Iterator, size: int) -> typing.Iterator[list]:
+    while True:
+        _batch = list(itertools.islice(records, size))
+        if not _batch:
+            return
+        yield _batch
@@ -0,0 +1,133 @@
+import bisect
+import typing
+from typing import Dict, List, Set, Tuple
+
+# Every device is indexed under its name, its client id, the names of its ports and "client:port" addresses.
+# Queries of three characters or more are looked up by trigram and confirmed by substring, shorter ones by word prefix.
+
+DeviceKey = Tuple[int, int]
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[_i:_i + 3] for _i in range(len(text) - 2)}
+
+
+class _Document(typing.NamedTuple):
+    signature: tuple
+    name: str
+    text: str  # every indexed string, lower case, one per line
+    words: Set[str]
+    trigrams: Set[str]
+
+
+class SearchIndex:
+    """Maps search queries to device keys, kept up to date by update() with every new topology snapshot"""
+
+    def __init__(self):
+        self._documents: Dict[DeviceKey, _Document] = {}
+        self._by_trigram: Dict[str, Set[DeviceKey]] = {}
+        self._by_word: Dict[str, Set[DeviceKey]] = {}
+        self._words: List[str] = []  # sorted, for prefix lookups
+        self._words_dirty = False
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def __contains__(self, key: DeviceKey) -> bool:
+        return key in self._documents
+
+    @staticmethod
+    def device_key(device) -> DeviceKey:
+        return device.id, device.type.value
+
+    def update(self, devices: typing.Iterable) -> bool:
+        """Re-indexes only the devices that appeared, vanished or changed, returns whether anything did"""
+        _wanted = {self.device_key(_device): _device for _device in devices}
+        _changed = False
+
+        for _key in [_key for _key in self._documents if _key not in _wanted]:
+            self.remove(_key)
+            _changed = True
+
+        for _key, _device in _wanted.items():
+            _document = self._documents.get(_key)
+            if _document is None or _document.signature != self._signature(_device):
+                self.add(_device)
+                _changed = True
+        return _changed
+
+    @staticmethod
+    def _signature(device) -> tuple:
+        return device.name, tuple((_channel[0], _channel[1]) for _channel in device.channels)
+
+    def add(self, device):
+        _key = self.device_key(device)
+        if _key in self._documents:
+            self.remove(_key)
+
+        _strings = [device.name, str(device.id)]
+        for _channel in device.channels:
+            _strings.append(_channel[1])
+            _strings.append(f"{device.id}:{_channel[0]}")
+        _strings = [_string.lower() for _string in _strings]
+
+        _words = {_word for _string in _strings for _word in _string.split()}
+        _trigrams = set().union(*(trigrams(_string) for _string in _strings))
+        self._documents[_key] = _Document(self._signature(device), device.name.lower(), "\n".join(_strings),
+                                          _words, _trigrams)
+
+        for _trigram in _trigrams:
+            self._by_trigram.setdefault(_trigram, set()).add(_key)
+        for _word in _words:
+            _keys = self._by_word.setdefault(_word, set())
+            if not _keys:
+                self._words_dirty = True
+            _keys.add(_key)
+
+    def remove(self, key: DeviceKey):
+        _document = self._documents.pop(key, None)
+        if _document is None:
+            return
+        for _trigram in _document.trigrams:
+            _keys = self._by_trigram[_trigram]
+            _keys.discard(key)
+            if not _keys:
+                del self._by_trigram[_trigram]
+        for _word in _document.words:
+            _keys = self._by_word[_word]
+            _keys.discard(key)
+            if not _keys:
+                del self._by_word[_word]
+                self._words_dirty = True
+
+    def _prefix_matches(self, prefix: str) -> Set[DeviceKey]:
+        if self._words_dirty:
+            self._words = sorted(self._by_word)
+            self._words_dirty = False
+        _matches = set()
+        _i = bisect.bisect_left(self._words, prefix)
+        while _i < len(self._words) and self._words[_i].startswith(prefix):
+            _matches |= self._by_word[self._words[_i]]
+            _i += 1
+        return _matches
+
+    def search(self, query: str) -> List[DeviceKey]:
+        """Returns the keys of the matching devices, best match first"""
+        _query = query.strip().lower()
+        if not _query:
+            return []
+
+        if len(_query) < 3:
+            _candidates = self._prefix_matches(_query)
+        else:
+            _sets = sorted((self._by_trigram.get(_trigram, set()) for _trigram in trigrams(_query)), key=len)
+            _candidates = set(_sets[0]).intersection(*_sets[1:]) if _sets[0] else set()
+            _candidates = {_key for _key in _candidates if _query in self._documents[_key].text}
+
+        def _rank(key: DeviceKey):
+            _name = self._documents[key].name
+            # exact name or client id, then name prefix, then name substring, then any other match
+            return (_name != _query and str(key[0]) != _query, not _name.startswith(_query), _query not in _name,
+                    len(_name), key)
+
+        return sorted(_candidates, key=_rank)
@@ -1,140 +1,171 @@
 import math
-import subprocess
+import threading
+import time
 import typing
 from typing import List
 
-from PyQt5.QtCore import QLine, Qt, QEvent, QRectF, QRect, QPointF
-from PyQt5.QtGui import QColor, QPen, QMouseEvent, QPainter, QPainterPath, QFont, QBrush, QFocusEvent
+from PyQt5.QtCore import QLine, Qt, QEvent, QRectF, QRect, QPointF, QObject, QThread, QTimer, pyqtSignal, pyqtSlot
+from PyQt5.QtGui import QColor, QPen, QMouseEvent, QPainter, QPainterPath, QFont, QBrush, QFocusEvent, QPixmap, \
+    QTransform, QStaticText, QWheelEvent, QFontMetrics
 from PyQt5.QtWidgets import QWidget, QListWidgetItem, QGraphicsItem, QGraphicsScene, QGraphicsView, \
     QFrame, QVBoxLayout, QGraphicsTextItem, QStyleOptionGraphicsItem, \
-    QGraphicsProxyWidget, QLabel, QHBoxLayout, QSizePolicy, QRadioButton, QSpacerItem, QGraphicsSceneMouseEvent
+    QGraphicsProxyWidget, QLabel, QHBoxLayout, QSizePolicy, QRadioButton, QSpacerItem, QGraphicsSceneMouseEvent, \
+    QGraphicsPathItem
 from PyQt5.uic.Compiler.qtproxies import QtGui
 
+import instrument
+from core import DeviceType, Port, Client, Edge, PatchResult, ConnectionGraph, TopologySnapshot, SequencerBackend, \
+    AConnectBackend, ProcfsBackend, AConnectionHandler, MidiDevice
 
-class DeviceType:
-    input = 0
-    output = 1
 
-    def __init__(self, value):
-        self.value = value
+class TopologyRefreshWorker(QObject):
+    """Acquires topology snapshots on its own thread and hands them to the GUI thread via snapshot_ready"""
+    snapshot_ready = pyqtSignal(object)
+    refresh_failed = pyqtSignal(str)
+    _refresh_requested = pyqtSignal()
 
-    def __repr__(self):
-        if self.value == DeviceType.input:
-            return "Input"
-        elif self.value == DeviceType.output:
-            return "Output"
-        else:
-            raise ValueError("DeviceType's value must always be in range [0, 1] - Input/Output")
-
-
-class AConnectionHandler:
-    @classmethod
-    def parse_device_list(cls, param: str) -> list:
-        _stdout = subprocess.getoutput(
-            f"export LANG=en_EN.UTF-8; aconnect -{param}")  # make sure the output is a certain language
-
-        # For some reason aconnect uses \t and spaces to indent lines
-        _stdout = _stdout.replace("    ", "\t")
-
-        _curr_client: list = []
-        _curr_channel: list = []
-        _out: list = []
-
-        for _line in _stdout.splitlines():
-            if _line.startswith("client"):  # if a client is declared
-                if _curr_client:  # if current client is finished
-                    _out.append(_curr_client)
-                _curr_client = [_line.replace("client ", "").replace(":", "").replace(" ", "").split("'"),
-                                []]  # parse a client
-                _curr_client[0][0] = int(_curr_client[0][0])
-                continue
-            elif _line.replace("\t", "").split()[0].replace(" ", "").isdigit():  # if a channel is declared
-                _channel = _line.replace("\t", "").replace(" ", "").split("'")  # parse a channel
-                del _channel[2]
-                _curr_channel = _channel
-                _curr_channel[0] = int(_curr_channel[0])
-                _curr_client[1].append(_channel)
-                continue
-            elif _line.startswith("\t"):  # if a connection is declared
-                if _line.startswith("	Connected From: "):
-                    _temp = _line.replace("	Connected From: ", "").replace(" ", "").split(",")
-                    _conns = [_conn.split(":") for _conn in _temp]
-                    _conns = [[int(_conn[0]), int(_conn[1]), DeviceType.input] for _conn in _conns]
-                    _curr_channel.append(_conns)
-                elif _line.startswith("	Connecting To: "):
-                    _temp = _line.replace("	Connecting To: ", "").replace(" ", "").split(",")
-                    _conns = [_conn.split(":") for _conn in _temp]
-                    _conns = [[int(_conn[0]), int(_conn[1]), DeviceType.output] for _conn in _conns]
-                    _curr_channel.append(_conns)
-
-        _out.append(_curr_client)  # Also append if there is no new client coming afterwards
-        return _out
-
-    @classmethod
-    def get_output_devices(cls) -> List["MidiDevice"]:
-        _dev_list = cls.parse_device_list("o")
-        return [MidiDevice(_device[0][0], _device[0][1], _device[0][2], DeviceType.output, _device[1]) for _device in
-                _dev_list]
-
-    @classmethod
-    def get_input_devices(cls) -> List["MidiDevice"]:
-        _dev_list = cls.parse_device_list("i")
-        return [MidiDevice(_device[0][0], _device[0][1], _device[0][2], DeviceType.input, _device[1]) for _device in
-                _dev_list]
-
-    @classmethod
-    def get_connections(cls):
-        _temp = []
-        _out = []
-        _curr_dev_id = 0
-        _curr_ch_id = 0
-        for _dev in cls.parse_device_list("l"):
-            _curr_dev_id = _dev[0][0]
-            for _channel in _dev[1]:
-                _curr_ch_id = _channel[0]
-                if len(_channel) == 3:
-                    for _conn in _channel[2]:
-                        if _conn[2] == DeviceType.input:  # Only outputting connections should be at index 0
-                            continue
-                        _out.append([[_curr_dev_id, _curr_ch_id], [_conn[0], _conn[1]]])  # [[From where], [to where]]
-        return _out
-
-
-class MidiDevice:
-    def __init__(self, _id: int, name: str, args: str, _type: int, channels=None):
+    def __init__(self):
         super().__init__()
-        # Setup class attributes
-        if channels is None:
-            channels = []
-        self.id = _id
-        self.name = name
-        self.args = args
-        self.type = DeviceType(_type)
+        self._lock = threading.Lock()
+        self._pending = False
+
+        self._thread = QThread()
+        self.moveToThread(self._thread)
+        self._refresh_requested.connect(self._refresh)  # queued, as this object now lives in _thread
+        self._thread.start()
+
+    def request_refresh(self):
+        # Requests arriving before the worker picked up the previous one are folded into it
+        with self._lock:
+            if self._pending:
+                return
+            self._pending = True
+        self._refresh_requested.emit()
+
+    @pyqtSlot()
+    def _refresh(self):
+        with self._lock:
+            self._pending = False
+        try:
+            _snapshot = AConnectionHandler.get_snapshot(max_age=0)
+        except Exception as _error:
+            self.refresh_failed.emit(str(_error))
+            return
+        self.snapshot_ready.emit(_snapshot)
+
+    def stop(self):
+        self._thread.quit()
+        self._thread.wait()
+
 
-        self.channels = channels
+class QDMNodeEditor(QGraphicsView):
+    RENDER_HINTS = QPainter.Antialiasing | QPainter.HighQualityAntialiasing | QPainter.TextAntialiasing | \
+        QPainter.SmoothPixmapTransform
 
-    def __repr__(self):
-        return f"{self.id}: {self.name}, Args: {self.args}, Channels: {self.channels}, Type: {self.type}"
+    ZOOM_STEP = 1.25  # per wheel notch
+    MIN_ZOOM = 0.05
+    MAX_ZOOM = 4.0
+    RENDER_HINTS_ZOOM = 0.35  # below this scale antialiasing costs more than it shows
 
+    OVERLAY_RECT = QRectF(8, 8, 340, 200)  # viewport area of the instrumentation overlay
+    OVERLAY_INTERVAL_MS = 500
 
-class QDMNodeEditor(QGraphicsView):
-    def __init__(self, place_holder: QFrame, node_scene: "QDMNodeEditorScene", main_class):
+    def __init__(self, place_holder: QFrame, node_scene: "QDMNodeEditorScene", main_class,
+                 viewport_update_mode: QGraphicsView.ViewportUpdateMode = QGraphicsView.SmartViewportUpdate):
         super().__init__()
         place_holder.layout().addWidget(self)
 
         self.scene = node_scene
         self.main_class = main_class
 
+        self.zoom = 1.0
+        self.detailed = True  # whether nodes show their title and channel rows at the current zoom
+
         self.setScene(self.scene)
-        self.setRenderHints(
-            QPainter.Antialiasing | QPainter.HighQualityAntialiasing | QPainter.TextAntialiasing |
-            QPainter.SmoothPixmapTransform)
+        self.setRenderHints(self.RENDER_HINTS)
+        self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
 
-        self.setViewportUpdateMode(QGraphicsView.FullViewportUpdate)
+        # Repainting only the damaged regions keeps drag frame times independent of the viewport size
+        self.setViewportUpdateMode(viewport_update_mode)
+        if self.scene.cached_background:
+            self.setCacheMode(QGraphicsView.CacheBackground)
 
         self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
         self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
 
+        # The overlay only repaints with its own region, the timer keeps it current while nothing else changes
+        self._overlay_timer = QTimer(self)
+        self._overlay_timer.timeout.connect(self.refresh_overlay)
+        self._overlay_items = 0
+        self.show_overlay(instrument.enabled)
+
+    def show_overlay(self, visible: bool):
+        if visible:
+            self._overlay_timer.start(self.OVERLAY_INTERVAL_MS)
+            self.refresh_overlay()
+        else:
+            self._overlay_timer.stop()
+            self.viewport().update(self.OVERLAY_RECT.toAlignedRect())
+
+    def refresh_overlay(self):
+        self._overlay_items = len(self.scene.items())  # counted here rather than inside the measured frame
+        self.viewport().update(self.OVERLAY_RECT.toAlignedRect())
+
+    def scrollContentsBy(self, dx: int, dy: int):
+        super().scrollContentsBy(dx, dy)
+        if instrument.enabled:  # panning scrolls the overlay's pixels along with the scene
+            _rect = self.OVERLAY_RECT.toAlignedRect()
+            self.viewport().update(_rect.united(_rect.translated(dx, dy)))
+
+    def paintEvent(self, event):
+        if not instrument.enabled:
+            return super().paintEvent(event)
+        _start = time.perf_counter()
+        super().paintEvent(event)
+        instrument.end_frame(_start)
+
+    def drawForeground(self, painter: QPainter, rect: QRectF):
+        if not instrument.enabled:
+            return
+        _fps, _worst = instrument.frame_stats()
+        _lines = [f"{_fps:.0f} fps, worst frame {_worst:.1f} ms", f"{self._overlay_items} items"]
+        _lines += [f"{_name}: {_calls}x {_seconds * 1000:.2f} ms"
+                   for _name, (_calls, _seconds) in sorted(instrument.last_frame.items())]
+
+        painter.save()
+        painter.resetTransform()  # the overlay stays in place while the scene pans and zooms
+        painter.setClipRect(self.OVERLAY_RECT)
+        painter.setFont(NodeStyle.shared().font)
+        _text = self.OVERLAY_RECT.adjusted(6, 4, -6, -4)
+        _text = painter.boundingRect(_text, Qt.AlignLeft | Qt.AlignTop, "\n".join(_lines))
+        painter.fillRect(_text.adjusted(-6, -4, 6, 4), QColor(0, 0, 0, 180))
+        painter.setPen(QColor(Qt.white))
+        painter.drawText(_text, Qt.AlignLeft | Qt.AlignTop, "\n".join(_lines))
+        painter.restore()
+
+    def wheelEvent(self, event: QWheelEvent):
+        _notches = event.angleDelta().y() / 120
+        if not _notches:
+            return super().wheelEvent(event)
+        self.set_zoom(self.zoom * self.ZOOM_STEP ** _notches)
+
+    def set_zoom(self, zoom: float):
+        _zoom = min(max(zoom, self.MIN_ZOOM), self.MAX_ZOOM)
+        if _zoom == self.zoom:
+            return
+        self.scale(_zoom / self.zoom, _zoom / self.zoom)
+        self.zoom = _zoom
+
+        self.setRenderHints(self.RENDER_HINTS if _zoom >= self.RENDER_HINTS_ZOOM else QPainter.RenderHints())
+
+        # Hidden children are skipped entirely by the scene, so the overview only paints one rectangle per node
+        _detailed = _zoom >= Node.DETAIL_LOD
+        if _detailed != self.detailed:
+            self.detailed = _detailed
+            for _item in self.scene.items():
+                if isinstance(_item, Node):
+                    _item.set_detailed(_detailed)
+
     def mousePressEvent(self, event):
         if event.button() == Qt.MiddleButton:
             self.middleMouseButtonPress(event)
@@ -184,7 +215,10 @@ class QDMNodeEditor(QGraphicsView):
 
 
 class QDMNodeEditorScene(QGraphicsScene):
-    def __init__(self, grid_size: int, grid_squares: int, parent: QGraphicsView):
+    MAX_CACHED_TILES = 8  # one tile per zoom level, so zooming around does not grow the cache forever
+    BULK_INSERT_THRESHOLD = 32  # below this, rebuilding the whole index costs more than it saves
+
+    def __init__(self, grid_size: int, grid_squares: int, parent: QGraphicsView, cached_background: bool = True):
         super().__init__(parent)
         self.parent = parent
 
@@ -200,12 +234,107 @@ class QDMNodeEditorScene(QGraphicsScene):
         self._pen_dark = QPen(self._color_dark)
         self._pen_dark.setWidth(2)
 
+        # Pre-rendered grid tiles keyed by the view scale they were rendered for
+        self.cached_background = cached_background
+        self._background_tiles: typing.Dict[float, QBrush] = {}
+
+        self.moving_nodes = False  # set while move_nodes repositions many nodes at once
+
         self.scene_width, self.scene_height = 64000, 64000
 
         self.setSceneRect(-self.scene_width // 2, -self.scene_height // 2, self.scene_width, self.scene_height)
         self.setBackgroundBrush(self._color_background)
 
+    def add_items(self, items: typing.Iterable[QGraphicsItem]):
+        """Adds the items not yet in this scene, suspending the BSP index for large batches"""
+        _new = [_item for _item in items if _item.scene() is not self]
+        if len(_new) < self.BULK_INSERT_THRESHOLD:
+            for _item in _new:
+                self.addItem(_item)
+            return
+
+        # Re-enabling the index rebuilds the BSP tree once instead of inserting into it item by item
+        _index_method = self.itemIndexMethod()
+        self.setItemIndexMethod(QGraphicsScene.NoIndex)
+        for _item in _new:
+            self.addItem(_item)
+        self.setItemIndexMethod(_index_method)
+
+    def move_nodes(self, positions: typing.Dict["Node", QPointF]):
+        """Moves many nodes in one go, rebuilding the index once and every affected edge path once"""
+        _index_method = self.itemIndexMethod()
+        self.setItemIndexMethod(QGraphicsScene.NoIndex)
+        self.moving_nodes = True
+        try:
+            for _node, _pos in positions.items():
+                _node.setPos(_pos)
+        finally:
+            self.moving_nodes = False
+
+        for _edge in {_edge for _node in positions for _edge in _node.edges}:
+            _edge.update_path()
+        self.setItemIndexMethod(_index_method)
+
+    def set_grid(self, grid_size: int, grid_squares: int):
+        self.grid_size = grid_size
+        self.grid_squares = grid_squares
+        self.invalidate_background()
+
+    def set_colors(self, background: QColor = None, light: QColor = None, dark: QColor = None):
+        if background is not None:
+            self._color_background = QColor(background)
+            self.setBackgroundBrush(self._color_background)
+        if light is not None:
+            self._color_light = QColor(light)
+            self._pen_light.setColor(self._color_light)
+        if dark is not None:
+            self._color_dark = QColor(dark)
+            self._pen_dark.setColor(self._color_dark)
+        self.invalidate_background()
+
+    def invalidate_background(self):
+        self._background_tiles.clear()
+        self.invalidate(self.sceneRect(), QGraphicsScene.BackgroundLayer)
+
+    def background_tile(self, scale: float) -> QBrush:
+        """Returns a brush holding one dark-line-to-dark-line grid cell, rendered at the given view scale"""
+        _scale = round(scale, 3)
+        _brush = self._background_tiles.get(_scale)
+        if _brush is not None:
+            return _brush
+
+        _tile = self.grid_size * self.grid_squares
+        _pixels = max(1, round(_tile * _scale))
+        _pixmap = QPixmap(_pixels, _pixels)
+        _pixmap.fill(self._color_background)
+
+        _painter = QPainter(_pixmap)
+        _painter.scale(_pixels / _tile, _pixels / _tile)
+        _painter.setPen(self._pen_light)
+        for _i in range(1, self.grid_squares):
+            _painter.drawLine(_i * self.grid_size, 0, _i * self.grid_size, _tile)
+            _painter.drawLine(0, _i * self.grid_size, _tile, _i * self.grid_size)
+
+        # The dark lines sit on the tile border, each tile draws its half of them
+        _painter.setPen(self._pen_dark)
+        for _edge in (0, _tile):
+            _painter.drawLine(_edge, 0, _edge, _tile)
+            _painter.drawLine(0, _edge, _tile, _edge)
+        _painter.end()
+
+        _brush = QBrush(_pixmap)
+        _brush.setTransform(QTransform.fromScale(_tile / _pixels, _tile / _pixels))
+
+        if len(self._background_tiles) >= self.MAX_CACHED_TILES:
+            self._background_tiles.clear()
+        self._background_tiles[_scale] = _brush
+        return _brush
+
     def drawBackground(self, painter, rect):
+        if self.cached_background:
+            painter.fillRect(rect, self.background_tile(painter.worldTransform().m11()))
+            return
+
         super().drawBackground(painter, rect)
 
         left = int(math.floor(rect.left()))
@@ -236,25 +365,60 @@ class QDMNodeEditorScene(QGraphicsScene):
         painter.drawLines(*lines_dark)
 
 
+class NodeStyle:
+    """
+        Fonts, pens and brushes shared by every node, socket, channel and edge. Qt copies them on write, so they are
+        never modified after construction. NodeStyle.shared() builds them once the QApplication exists.
+    """
+    __slots__ = ("font", "title_color", "bg_color", "pen_default", "pen_selected", "brush_title", "brush_background",
+                 "pen_text", "pen_socket", "brush_socket", "pen_edge", "channel_style_sheet")
+
+    _shared: typing.Optional["NodeStyle"] = None
+
+    def __init__(self):
+        self.font = QFont("Ubuntu", 10)
+        self.title_color = QColor(Qt.white)
+        self.bg_color = "#E3212121"
+
+        self.pen_default = QPen(QColor("#7F000000"))
+        self.pen_selected = QPen(QColor("#999999"))
+        self.brush_title = QBrush(QColor("#FF313131"))
+        self.brush_background = QBrush(QColor(self.bg_color))
+
+        self.pen_text = QPen(QColor(Qt.white))
+
+        self.pen_socket = QPen(QColor("#FF000000"))
+        self.pen_socket.setWidthF(QDMGraphicsSocket.outline_width)
+        self.brush_socket = QBrush(QColor("#FFFF7700"))
+
+        self.pen_edge = QPen(QColor("#CCFF7700"))
+        self.pen_edge.setWidthF(2.0)
+
+        # One sheet per node content widget instead of one per channel widget
+        self.channel_style_sheet = "QWidget{ background-color: transparent; } " \
+                                   "QRadioButton{ background-color: " + self.bg_color + "; }"
+
+    @classmethod
+    def shared(cls) -> "NodeStyle":
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+
 class QDMGraphicsSocket(QGraphicsItem):
+    radius = 6.0
+    outline_width = 1.0
+
     def __init__(self, parent=None):
         super().__init__(parent)
 
-        self.radius = 6.0
-        self.outline_width = 1.0
-        self._color_background = QColor("#FFFF7700")
-        self._color_outline = QColor("#FF000000")
-
-        self._pen = QPen(self._color_outline)
-        self._pen.setWidthF(self.outline_width)
-        self._brush = QBrush(self._color_background)
-
     def paint(self, painter: QtGui.QPainter, option: 'QStyleOptionGraphicsItem',
               widget: typing.Optional[QWidget] = ...) -> None:
-        # painting circle
-        painter.setBrush(self._brush)
-        painter.setPen(self._pen)
-        painter.drawEllipse(-self.radius, -self.radius, 2 * self.radius, 2 * self.radius)
+        # painting circle, sockets are the most numerous items so they hold no reference to the style themselves
+        _style = NodeStyle.shared()
+        painter.setBrush(_style.brush_socket)
+        painter.setPen(_style.pen_socket)
+        painter.drawEllipse(QRectF(-self.radius, -self.radius, 2 * self.radius, 2 * self.radius))
 
     def boundingRect(self):
         return QRectF(
@@ -265,6 +429,91 @@ class QDMGraphicsSocket(QGraphicsItem):
         )
 
 
+class QDMChannelItem(QGraphicsItem):
+    """A channel row painted straight onto its node, the lightweight counterpart of QDMChannelWidget"""
+
+    def __init__(self, channel, node: "Node", index: int):
+        super().__init__(node)
+
+        self.style = node.style
+        self.channel = channel
+        self.node = node
+
+        self.width = node.width - 2 * node.padding
+        self.height = node.channel_height
+
+        # Connections arrive at the left of output devices and leave from the right of input devices
+        _socket_size = QDMGraphicsSocket.radius + QDMGraphicsSocket.outline_width
+        _socket_left = node.device.type.value == DeviceType.output
+
+        # Elided to the space beside the socket, the row must not paint outside its bounds
+        _label = f"{self.channel[0]}: {self.channel[1]}"
+        _elided = QFontMetrics(self.style.font).elidedText(_label, Qt.ElideRight,
+                                                           int(self.width - 2 * _socket_size - node.padding))
+        if _elided != _label:
+            self.setToolTip(_label)
+        self.text = QStaticText(_elided)
+        self.text.setTextFormat(Qt.PlainText)
+        self.text.prepare(QTransform(), self.style.font)
+        self._text_pos = QPointF(2 * _socket_size + node.padding if _socket_left else 0,
+                                 (self.height - self.text.size().height()) / 2)
+
+        self.socket = QDMGraphicsSocket(self)
+        self.socket.setPos(_socket_size if _socket_left else self.width - _socket_size, self.height / 2)
+
+        self.setPos(node.padding, node.title_height + index * node.channel_height)
+
+    def boundingRect(self):
+        return QRectF(0, 0, self.width, self.height)
+
+    def paint(self, painter, option, widget=None):
+        painter.setFont(self.style.font)
+        painter.setPen(self.style.pen_text)
+        painter.drawStaticText(self._text_pos, self.text)
+
+
+class QDMGraphicsEdge(QGraphicsPathItem):
+    """Cubic connection between two sockets, only recomputed when one of its two nodes moves"""
+
+    def __init__(self, edge: Edge, start_node: "Node", end_node: "Node"):
+        super().__init__()
+
+        self.edge = edge
+        self.start_node = start_node
+        self.end_node = end_node
+        self._shape: typing.Optional[QPainterPath] = None
+
+        self.setPen(start_node.style.pen_edge)
+        self.setZValue(-2)
+        self.setAcceptedMouseButtons(Qt.NoButton)
+
+        self.start_node.edges.add(self)
+        self.end_node.edges.add(self)
+        self.update_path()
+
+    def update_path(self):
+        _start = self.start_node.sockets[self.edge.src_port].scenePos()
+        _end = self.end_node.sockets[self.edge.dst_port].scenePos()
+        _bend = max(abs(_end.x() - _start.x()) * 0.5, 40.0)
+
+        _path = QPainterPath(_start)
+        _path.cubicTo(_start.x() + _bend, _start.y(), _end.x() - _bend, _end.y(), _end.x(), _end.y())
+        self._shape = None
+        self.setPath(_path)  # also moves the edge within the scene index, which culls it outside the viewport
+
+    def shape(self) -> QPainterPath:
+        # The stroked outline is only needed for hit tests, so it is built on demand and kept until the path changes
+        if self._shape is None:
+            self._shape = super().shape()
+        return self._shape
+
+    def detach(self):
+        self.start_node.edges.discard(self)
+        self.end_node.edges.discard(self)
+        if self.scene() is not None:
+            self.scene().removeItem(self)
+
+
 class QDMChannelWidget(QWidget):
     def __init__(self, channel, node: "Node"):
         super().__init__()
@@ -273,10 +522,9 @@ class QDMChannelWidget(QWidget):
         self.node = node
 
         self.setLayout(QHBoxLayout())
-        print(self.node.width)
         self.text: QLabel = QLabel(f"{self.channel[0]}: {self.channel[1]}")
-        self.text.setFont(QFont("Ubuntu", 10))
-        self.text.setGeometry(self.node.width, self.node.channel_height, 0, 0)
+        self.text.setFont(self.node.style.font)
+        self.text.setGeometry(int(self.node.width), self.node.channel_height, 0, 0)
 
         self.layout().setContentsMargins(0, 0, 0, 0)
         self.layout().addWidget(self.text)
@@ -287,8 +535,7 @@ class QDMChannelWidget(QWidget):
         self.socket_button = QRadioButton()
         self.layout().addWidget(self.socket_button)
 
-        self.setStyleSheet("QRadioButton{ background-color: " + self.node.bg_color + "; }")
-        self.setMaximumWidth(self.node.width - 10)
+        self.setMaximumWidth(int(self.node.width - 10))
 
     def focusInEvent(self, event: QFocusEvent) -> None:
         self.node.setZValue(1)
@@ -305,7 +552,7 @@ class QDMNodeContentWidget(QWidget):
         self.setLayout(QVBoxLayout())
         self.layout().setContentsMargins(0, 0, 0, 0)
 
-        self.setStyleSheet("QWidget{ background-color: transparent; }")
+        self.setStyleSheet(self.node.style.channel_style_sheet)
 
         self.init_ui()
 
@@ -319,49 +566,99 @@ class QDMNodeContentWidget(QWidget):
 
 
 class Node(QGraphicsItem):
-    def __init__(self, device: MidiDevice, parent: QDMNodeEditor, pos=None):
-        super().__init__()
+    CHANNEL_ITEMS = "items"  # rows are QDMChannelItems painted on the node
+    CHANNEL_WIDGETS = "widgets"  # rows are QDMChannelWidgets inside a QGraphicsProxyWidget
+    channel_mode = CHANNEL_ITEMS
 
-        if pos is None:
-            pos = QPointF(0, 0)
+    # Pixmap cache used for the node's own painting, QGraphicsItem.NoCache paints the paths every time
+    cache_mode = QGraphicsItem.DeviceCoordinateCache
 
-        self._title_color = Qt.white
-        self._title_font = QFont("Ubuntu", 10)
+    DETAIL_LOD = 0.5  # below this level of detail nodes are plain rectangles without title or channel rows
 
-        self.base_width = 180
-        self.base_height = 25
-        self.channel_height = 35
-        self.edge_size = 10.0
-        self.title_height = 24.0
-        self.padding = 4.0
+    # Geometry is the same for every node
+    base_width = 180
+    base_height = 25
+    channel_height = 35
+    edge_size = 10.0
+    title_height = 24.0
+    padding = 4.0
 
-        self._pen_default = QPen(QColor("#7F000000"))
-        self._pen_selected = QPen(QColor("#999999"))
+    def __init__(self, device: MidiDevice, parent: QDMNodeEditor, pos=None, channel_mode: str = None):
+        super().__init__()
 
-        self._brush_title = QBrush(QColor("#FF313131"))
-        self.bg_color = "#E3212121"
-        self._brush_background = QBrush(QColor(self.bg_color))
+        if pos is None:
+            pos = QPointF(0, 0)
+        if channel_mode is not None:
+            self.channel_mode = channel_mode
+
+        self.style = NodeStyle.shared()
 
         self.title = QGraphicsTextItem(self)
-        self.channels_text_objects = []
-        self.socket_positions = []
-        self.gr_content = QGraphicsProxyWidget(self)
+        self.channel_items: List[QDMChannelItem] = []
+        self.gr_content: typing.Optional[QGraphicsProxyWidget] = None
+        self.sockets: typing.Dict[int, QDMGraphicsSocket] = {}  # port id -> socket
+        self.edges: typing.Set[QDMGraphicsEdge] = set()
 
         self.device = device
         self.parent = parent
 
-        self.height = len(self.device.channels) * self.channel_height + self.base_height
-        self.width = self.title.textWidth() + self.padding + self.base_width
+        self.height = 0
+        self.width = 0
+        self._path_title = self._path_content = self._path_outline = QPainterPath()
+        self.update_geometry()
 
         self.init_title()
         self.init_contents()
+        self.set_detailed(parent.detailed)
 
-        self.setFlags(QGraphicsItem.ItemIsMovable | QGraphicsItem.ItemIsSelectable | QGraphicsItem.ItemIsFocusable)
+        # Placed before it sends geometry changes, so creating a node at a saved position is not journaled as a move
         self.setPos(pos.x(), pos.y())
+        self.setFlags(QGraphicsItem.ItemIsMovable | QGraphicsItem.ItemIsSelectable | QGraphicsItem.ItemIsFocusable |
+                      QGraphicsItem.ItemSendsGeometryChanges)
+        self.setCacheMode(self.cache_mode)
+
+    @staticmethod
+    def device_key(device: MidiDevice) -> typing.Tuple[int, int]:
+        return device.id, device.type.value
+
+    @property
+    def key(self) -> typing.Tuple[int, int]:
+        return self.device_key(self.device)
+
+    def set_device(self, device: MidiDevice) -> bool:
+        """Swaps in a newer description of the same device, rebuilding the contents only if they changed"""
+        _changed = (device.name, device.args, [tuple(_channel[:2]) for _channel in device.channels]) != \
+                   (self.device.name, self.device.args, [tuple(_channel[:2]) for _channel in self.device.channels])
+        self.device = device
+        if not _changed:
+            return False
+
+        self.update_geometry()
+
+        self.init_title()
+        self.init_contents()
+        self.set_detailed(self.parent.detailed)
+        self.update()
+        return True
 
     def remove(self):
-        self.parent.main_class.nodes.remove(self)
-        self.parent.scene.removeItem(self)
+        self.parent.main_class.delete_node(self)
+
+    def detach_edges(self):
+        for _edge in list(self.edges):
+            _edge.detach()
+
+    def itemChange(self, change: QGraphicsItem.GraphicsItemChange, value):
+        if change == QGraphicsItem.ItemPositionHasChanged:
+            _scene = self.scene()
+            if _scene is None or not _scene.moving_nodes:  # move_nodes updates the edges once all nodes are in place
+                for _edge in self.edges:
+                    _edge.update_path()
+            self.parent.main_class.node_moved(self)
+        return super().itemChange(change, value)
+
+    def connections(self) -> typing.FrozenSet[Edge]:
+        return self.parent.main_class.graph.client_edges(self.device.id)
 
     def keyPressEvent(self, event: QtGui.QKeyEvent) -> None:
         if event.key() == Qt.Key_Delete:
@@ -382,35 +679,52 @@ class Node(QGraphicsItem):
         ).normalized()
 
     def init_title(self):
-        self.title.setDefaultTextColor(self._title_color)
-        self.title.setFont(self._title_font)
+        self.title.setDefaultTextColor(self.style.title_color)
+        self.title.setFont(self.style.font)
         self.title.setPos(self.padding, 0)
         self.title.setPlainText(f"{self.device.name} - {self.device.type}")
 
     def init_contents(self):
-        """
-            _i = 0
-            for _each in self.device.channels:
-            _y = _i * self.channel_height + self.title_height
-            _temp = QGraphicsTextItem(self)
-            _temp.setPlainText(f"{_each[0]}: {_each[1]}")
-
-            _temp.setY(_y)
-            self.channels_text_objects.append(_temp)
-            self.socket_positions.append([self.x() + self.width, _y])
-            _i += 1
-
-        """
+        # Edges hang off the old sockets, the UI reattaches them to the new ones on its next edge update
+        self.detach_edges()
+        for _item in list(self.channel_items) + list(self.sockets.values()):
+            if _item.parentItem() is not self:  # sockets of channel items go along with their row
+                continue
+            _item.setParentItem(None)
+            if _item.scene() is not None:
+                _item.scene().removeItem(_item)
+        self.channel_items = []
+        self.sockets = {}
+
+        if self.channel_mode == Node.CHANNEL_ITEMS:
+            self.channel_items = [QDMChannelItem(_channel, self, _i) for _i, _channel in enumerate(self.device.channels)]
+            self.sockets = {_item.channel[0]: _item.socket for _item in self.channel_items}
+            return
+
+        _socket_x = 0 if self.device.type.value == DeviceType.output else self.width
+        for _i, _channel in enumerate(self.device.channels):
+            _socket = QDMGraphicsSocket(self)
+            _socket.setPos(_socket_x, self.title_height + (_i + 0.5) * self.channel_height)
+            self.sockets[_channel[0]] = _socket
+
+        if self.gr_content is None:
+            self.gr_content = QGraphicsProxyWidget(self)
+        _old_content = self.gr_content.widget()
         self.gr_content.setWidget(QDMNodeContentWidget(self))
         self.gr_content.setPos(self.padding, self.title_height + self.padding)
+        if _old_content is not None:
+            _old_content.deleteLater()
 
-    def paint(self, painter, q_style_option_graphics_item, widget=None):
-        # set values
+    def set_detailed(self, detailed: bool):
+        for _item in self.childItems():
+            _item.setVisible(detailed)
+
+    def update_geometry(self):
+        """Recomputes the size and outline paths, which only change with the title or the channel list"""
+        self.prepareGeometryChange()
         self.height = len(self.device.channels) * self.channel_height + self.base_height
         self.width = self.title.textWidth() + self.padding + self.base_width
 
-        # draw sockets
-
         # title
         path_title = QPainterPath()
         path_title.setFillRule(Qt.WindingFill)
@@ -418,9 +732,7 @@ class Node(QGraphicsItem):
         path_title.addRect(0, self.title_height - self.edge_size, self.edge_size, self.edge_size)
         path_title.addRect(self.width - self.edge_size, self.title_height - self.edge_size, self.edge_size,
                            self.edge_size)
-        painter.setPen(Qt.NoPen)
-        painter.setBrush(self._brush_title)
-        painter.drawPath(path_title.simplified())
+        self._path_title = path_title.simplified()
 
         # content
         path_content = QPainterPath()
@@ -429,13 +741,35 @@ class Node(QGraphicsItem):
                                     self.edge_size)
         path_content.addRect(0, self.title_height, self.edge_size, self.edge_size)
         path_content.addRect(self.width - self.edge_size, self.title_height, self.edge_size, self.edge_size)
-        painter.setPen(Qt.NoPen)
-        painter.setBrush(self._brush_background)
-        painter.drawPath(path_content.simplified())
+        self._path_content = path_content.simplified()
 
         # outline
         path_outline = QPainterPath()
         path_outline.addRoundedRect(0, 0, self.width, self.height, self.edge_size, self.edge_size)
-        painter.setPen(self._pen_default if not self.isSelected() else self._pen_selected)
+        self._path_outline = path_outline.simplified()
+
+    def paint(self, painter, q_style_option_graphics_item, widget=None):
+        if q_style_option_graphics_item.levelOfDetailFromTransform(painter.worldTransform()) < self.DETAIL_LOD:
+            painter.setPen(self.style.pen_selected if self.isSelected() else Qt.NoPen)
+            painter.setBrush(self.style.brush_title)
+            painter.drawRect(self.boundingRect())
+            return
+
+        # draw sockets
+
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(self.style.brush_title)
+        painter.drawPath(self._path_title)
+
+        painter.setBrush(self.style.brush_background)
+        painter.drawPath(self._path_content)
+
+        painter.setPen(self.style.pen_default if not self.isSelected() else self.style.pen_selected)
         painter.setBrush(Qt.NoBrush)
-        painter.drawPath(path_outline.simplified())
+        painter.drawPath(self._path_outline)
+
+
+instrument.probe(Node, "__init__", "Node construction")
+instrument.probe(Node, "paint")
+instrument.probe(QDMChannelItem, "paint")
+instrument.probe(QDMNodeEditorScene, "drawBackground")